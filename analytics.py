@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+from kinovea import TIME_COL
+
+# Segments in the order their speeds should peak in a proper kinematic sequence
+SEGMENTS = ["FK", "FH", "TS", "TE"]
+
+SEGMENT_PAIRS = list(zip(SEGMENTS[:-1], SEGMENTS[1:]))
+
+
+def metric_columns():
+    """Column names produced by batch_sequence_metrics, in order."""
+    columns = []
+    for seg in SEGMENTS:
+        columns += [f"{seg.lower()}_peak_speed", f"{seg.lower()}_peak_time"]
+    for a, b in SEGMENT_PAIRS:
+        columns += [f"{a.lower()}_{b.lower()}_gap_ms", f"{a.lower()}_{b.lower()}_speed_gain"]
+    return columns + ["peak_order", "proper_sequence"]
+
+
+def _stack_sessions(frames):
+    # Pads every session to the longest one so all of them can be reduced in
+    # one pass: times is (sessions, samples), speeds is (sessions, samples, segments).
+    n_samples = max((len(df) for df in frames), default=0)
+    times = np.full((len(frames), n_samples), np.nan, dtype=np.float64)
+    speeds = np.full((len(frames), n_samples, len(SEGMENTS)), np.nan, dtype=np.float64)
+
+    for i, df in enumerate(frames):
+        n = len(df)
+        if TIME_COL in df.columns:
+            times[i, :n] = df[TIME_COL].to_numpy(dtype=np.float64)
+        for j, seg in enumerate(SEGMENTS):
+            if seg in df.columns:
+                speeds[i, :n, j] = df[seg].to_numpy(dtype=np.float64)
+    return times, speeds
+
+
+def batch_sequence_metrics(frames, index=None):
+    """
+    Computes kinematic sequence metrics for a list of Kinovea frames at once and
+    returns one row per frame. Segments missing from a frame come out as NaN.
+
+    - <seg>_peak_speed / <seg>_peak_time: peak speed and the Time (ms) it occurs
+    - <a>_<b>_gap_ms: time from segment a's peak to segment b's peak
+    - <a>_<b>_speed_gain: peak speed of b divided by peak speed of a
+    - peak_order: segments sorted by time of peak, e.g. "FK > FH > TS > TE"
+    - proper_sequence: True when peaks follow FK > FH > TS > TE
+    """
+    times, speeds = _stack_sessions(frames)
+    n_sessions = len(frames)
+
+    if speeds.shape[1] == 0:
+        peak_speed = np.full((n_sessions, len(SEGMENTS)), np.nan)
+        peak_time = peak_speed.copy()
+    else:
+        # -inf stands in for padding and gaps so argmax ignores them
+        peak_idx = np.where(np.isnan(speeds), -np.inf, speeds).argmax(axis=1)
+        peak_speed = np.take_along_axis(speeds, peak_idx[:, None, :], axis=1)[:, 0, :]
+        peak_time = np.take_along_axis(times, peak_idx, axis=1)
+        peak_time[np.isnan(peak_speed)] = np.nan
+
+    gaps = np.diff(peak_time, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gains = peak_speed[:, 1:] / peak_speed[:, :-1]
+    gains[~np.isfinite(gains)] = np.nan
+
+    proper = np.all(gaps > 0, axis=1)
+
+    # NaN peak times sort last, so missing segments end up at the end of the order
+    order = np.argsort(peak_time, axis=1, kind="stable")
+    segment_names = np.array(SEGMENTS)
+    peak_order = [
+        " > ".join(segment_names[row][~np.isnan(peak_time[i, row])])
+        for i, row in enumerate(order)
+    ]
+
+    data = {}
+    for j, seg in enumerate(SEGMENTS):
+        data[f"{seg.lower()}_peak_speed"] = peak_speed[:, j]
+        data[f"{seg.lower()}_peak_time"] = peak_time[:, j]
+    for j, (a, b) in enumerate(SEGMENT_PAIRS):
+        data[f"{a.lower()}_{b.lower()}_gap_ms"] = gaps[:, j]
+        data[f"{a.lower()}_{b.lower()}_speed_gain"] = gains[:, j]
+    data["peak_order"] = peak_order
+    data["proper_sequence"] = proper
+
+    return pd.DataFrame(data, index=index, columns=metric_columns())
+
+
+def sequence_metrics(df):
+    """Kinematic sequence metrics for a single session, as a dict."""
+    return batch_sequence_metrics([df]).iloc[0].to_dict()
+
+
+def segment_summary(metrics):
+    """Per-segment peak table for display, built from sequence_metrics output."""
+    return pd.DataFrame({
+        "Segment": SEGMENTS,
+        "Peak speed (px/s)": [metrics[f"{seg.lower()}_peak_speed"] for seg in SEGMENTS],
+        "Time of peak (ms)": [metrics[f"{seg.lower()}_peak_time"] for seg in SEGMENTS],
+    })
+
+
+def align_sessions(frames, metric, event_segment="FH", window=(-400, 200), step=None):
+    """
+    Puts one metric from several sessions on a shared time axis, with 0 at each
+    session's event (the time of peak speed of event_segment), and resamples
+    every curve onto a common grid spanning window (ms around the event).
+
+    step defaults to the median sampling interval across the sessions. Grid
+    points outside a session's capture, and sessions missing the metric, the
+    event, a time column or at least two samples, come out as NaN. Returns
+    (grid, curves) where curves is (sessions, grid points).
+    """
+    event_times = batch_sequence_metrics(frames)[f"{event_segment.lower()}_peak_time"].to_numpy()
+    usable = [TIME_COL in df.columns and len(df) > 1 for df in frames]
+
+    if step is None:
+        intervals = [np.median(np.diff(df[TIME_COL].to_numpy())) for df, ok in zip(frames, usable) if ok]
+        step = float(np.median(intervals)) if intervals else 1.0
+    grid = np.arange(window[0], window[1] + step / 2, step)
+
+    curves = np.full((len(frames), len(grid)), np.nan)
+    for i, (df, event_time) in enumerate(zip(frames, event_times)):
+        if not usable[i] or metric not in df.columns or np.isnan(event_time):
+            continue
+        t = df[TIME_COL].to_numpy(dtype=np.float64) - event_time
+        curves[i] = np.interp(grid, t, df[metric].to_numpy(dtype=np.float64), left=np.nan, right=np.nan)
+    return grid, curves
+
+
+def mean_sd_band(curves):
+    """Mean and standard deviation across sessions at each grid point, ignoring NaN."""
+    counts = np.sum(~np.isnan(curves), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.nansum(curves, axis=0)
+        mean = np.where(counts > 0, total / np.maximum(counts, 1), np.nan)
+        sq = np.nansum((curves - mean) ** 2, axis=0)
+        sd = np.where(counts > 0, np.sqrt(sq / np.maximum(counts, 1)), np.nan)
+    return mean, sd
+
+
+def transition_summary(metrics):
+    """Peak-to-peak timing gaps and speed gains for display."""
+    return pd.DataFrame({
+        "Transition": [f"{a} → {b}" for a, b in SEGMENT_PAIRS],
+        "Gap (ms)": [metrics[f"{a.lower()}_{b.lower()}_gap_ms"] for a, b in SEGMENT_PAIRS],
+        "Speed gain": [metrics[f"{a.lower()}_{b.lower()}_speed_gain"] for a, b in SEGMENT_PAIRS],
+    })
@@ -1,23 +1,30 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
+import numpy as np
 import os
 from datetime import datetime
 import re
-import plotly.graph_objects as go
 
-VIDEO_DIR = "videos"
-os.makedirs(VIDEO_DIR, exist_ok=True)
+from analytics import SEGMENTS, align_sessions, segment_summary, sequence_metrics, transition_summary
+from browser import SESSION_SORTS, fetch_players_page, fetch_sessions_page, session_filters, team_names
+from charts import plot_aligned_overlay, plot_custom_lines
+from db import connect, query_df, query_rows
+from kinovea import COLOR_MAP, TIME_COL, file_key, load_session_data, write_columnar_copy
+from maintenance import (delete_orphan_files, delete_orphan_players, delete_player, delete_sessions,
+                         find_broken_sessions, find_orphan_files)
+from migrate_sessions_schema import run_migrations
+from percentiles import cohort_percentiles
+from profiling import run_elapsed_ms, run_timings, start_run, timed
+from search import search_sessions
+from session_metrics import stale_sessions
+from signals import derived_path_for, load_derived_channels
+from similarity import find_similar
+from storage import DATA_DIR, VIDEO_DIR, csv_path_for, store_video
+from uploads import refresh_session_summaries, save_session
+from video_index import frame_at, get_video_metadata, keyframe_before, refresh_all_video_metadata, video_time_s
+from writer import submit, write
 
-COLOR_MAP = {
-    "TE": "#1f77b4",  # blue
-    "FK": "#ff7f0e",  # orange
-    "TS": "#2ca02c",  # green
-    "FH": "#d62728",  # red
-    "Angle 1 - o": "#9467bd",  # purple
-    "Angle 1 - a": "#8c564b",  # brown
-    "Angle 1 - b": "#e377c2"   # pink
-}
+os.makedirs(VIDEO_DIR, exist_ok=True)
 
 def extract_youtube_id(url):
     """
@@ -39,67 +46,92 @@ def extract_youtube_id(url):
 
     return None
 
-def plot_custom_lines(df, x_col="Time (ms)", chart_key="default", selected_metrics=None):
-    fig = go.Figure()
-    metrics = selected_metrics if selected_metrics else COLOR_MAP.keys()
-
-    for col in df.columns:
-        if col in metrics and col in COLOR_MAP and col != x_col:
-            fig.add_trace(go.Scatter(
-                x=df[x_col],
-                y=df[col],
-                mode='lines',
-                name=col,
-                line=dict(color=COLOR_MAP.get(col, "#cccccc"))
-            ))
-    fig.update_layout(
-        xaxis_title=x_col,
-        yaxis_title="Speed (px/s)",
-        height=400,
-        legend_title="Metric",
-        template="simple_white"
-    )
-    st.plotly_chart(fig, use_container_width=True, key=chart_key)
+def show_video(video_source, side=None, seek_ms=None):
+    suffix = f" for {side.lower()} session" if side else ""
+
+    # Clicking the chart seeks to the clicked Kinovea time
+    metadata = None
+    if seek_ms is not None and not video_source.startswith("http"):
+        with connect() as conn:
+            metadata = get_video_metadata(conn, video_source)
+    start_s = video_time_s(seek_ms, metadata) if seek_ms is not None else 0
+
+    if video_source.startswith("http"):
+        video_id = extract_youtube_id(video_source)
+        if video_id:
+            st.video(f"https://www.youtube.com/embed/{video_id}", start_time=int(start_s))
+        elif side:
+            st.warning(f"⚠️ Invalid YouTube link{suffix}.")
+        else:
+            st.warning("⚠️ Could not extract video ID. Check the YouTube link.")
+    else:
+        if os.path.exists(video_source):
+            # The player only starts on whole seconds, the caption gives the exact frame
+            st.video(video_source, start_time=int(start_s))
+            if metadata:
+                # Fragmented mp4s index without frames, so fps and keyframes may be missing
+                frame, keyframe = frame_at(metadata, start_s), keyframe_before(metadata, start_s)
+                details = [f"{metadata['fps']:.1f} fps" if metadata["fps"] else None,
+                           f"keyframe at {keyframe:.2f} s" if keyframe is not None else None]
+                details = ", ".join(d for d in details if d)
+                st.caption(f"⏱ {seek_ms:.0f} ms → {start_s:.2f} s"
+                           + (f", frame {frame}" if frame is not None else "")
+                           + (f" ({details})" if details else ""))
+        else:
+            st.warning(f"⚠️ Local video file not found{suffix}.")
 
 
 # === Setup ===
-DB_PATH = "pitcher_biomech.db"
-DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Timing is opt-in from the checkbox at the bottom of the page
+start_run(st.session_state.get("show_timings", False), st.session_state.get("log_timings", False))
+
 # === DB Init ===
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS players (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        team TEXT,
-        notes TEXT
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        player_id INTEGER,
-        date TEXT,
-        session_name TEXT,
-        youtube_link TEXT,
-        kinovea_csv TEXT,
-        notes TEXT,
-        FOREIGN KEY(player_id) REFERENCES players(id)
-    )''')
-    conn.commit()
-    conn.close()
+    # Creates the tables on a fresh database and brings older ones up to date.
+    # Only the first run in this process migrates, later reruns return at once.
+    with connect() as conn, timed("sql", "schema migrations"):
+        run_migrations(conn)
 
 init_db()
 
-# === Title ===
-st.title(" Pitcher Biomechanics Tracker")
-
-# === Tabs ===
-tab1, tab2, tab3, tab4 = st.tabs([" Upload Session", " View Sessions", " Compare Sessions", "Admin"])
-
-# === TAB 1: Upload Session ===
-with tab1:
+# Only the active view runs on each rerun, and widgets inside a view are wrapped
+# in fragments so changing them reruns just that fragment, not the whole page.
+
+@st.fragment
+def metric_chart(df, csv_path, label, select_key, chart_key, arrow_path=None):
+    available_metrics = [col for col in df.columns if col in COLOR_MAP]
+    # Filtered and differentiated channels, computed once per CSV and cached on disk
+    derived = load_derived_channels(csv_path, arrow_path)
+    derived_metrics = [col for col in derived.columns if col != TIME_COL]
+    selected_metrics = st.multiselect(
+        label,
+        options=available_metrics + derived_metrics,
+        default=available_metrics,
+        key=select_key
+    )
+    selected_derived = [col for col in selected_metrics if col in derived_metrics]
+    if selected_derived:
+        df = pd.concat([df, derived[selected_derived]], axis=1)
+    event = plot_custom_lines(df, chart_key=chart_key, selected_metrics=selected_metrics,
+                              data_key=file_key(csv_path), on_select="rerun")
+
+    # A clicked point seeks this session's video, which lives outside the fragment
+    points = event.selection.points if event else []
+    if points:
+        seek = (csv_path, float(points[0]["x"]))
+        if st.session_state.get(f"{chart_key}_seek") != seek:
+            st.session_state[f"{chart_key}_seek"] = seek
+            st.rerun()
+
+def chart_seek_ms(chart_key, csv_path):
+    # Kinovea time last clicked on this chart, if it was clicked for this session
+    seek = st.session_state.get(f"{chart_key}_seek")
+    return seek[1] if seek and seek[0] == csv_path else None
+
+# === VIEW 1: Upload Session ===
+def upload_view():
     st.header("Upload New Session")
 
     with st.form("upload_form"):
@@ -111,57 +143,49 @@ with tab1:
         notes = st.text_area("Notes")
 
         youtube_link = ""
-        video_path = ""
+        uploaded_video = None
 
         if video_option == "YouTube Link":
             youtube_link = st.text_input("YouTube Link")
         else:
             uploaded_video = st.file_uploader("Upload Video File", type=["mp4", "mov", "avi"])
-            if uploaded_video:
-                video_filename = f"{name.replace(' ', '_')}_{session_name.replace(' ', '_')}.mp4"
-                video_path = os.path.join(VIDEO_DIR, video_filename)
 
         csv_file = st.file_uploader("Upload Kinovea CSV", type="csv")
         submitted = st.form_submit_button("Upload")
 
-        if submitted and (youtube_link or video_path):
+        if submitted and (youtube_link or uploaded_video):
             # Save CSV if provided
             csv_path = None
+            arrow_path = None
             if csv_file:
-                csv_path = f"{DATA_DIR}/{name.replace(' ', '_')}_{session_name.replace(' ', '_')}.csv"
-                with open(csv_path, "wb") as f:
+                csv_path = csv_path_for(name, session_name, session_date)
+                # "x" fails rather than overwrite if a concurrent upload took the name
+                with open(csv_path, "xb") as f:
                     f.write(csv_file.read())
 
-            # Save video file if needed
+                # Columnar copy so later views skip CSV parsing
+                try:
+                    arrow_path = write_columnar_copy(csv_path)
+                except Exception as e:
+                    st.warning(f"⚠️ Could not convert CSV to columnar format, the raw CSV will be used: {e}")
+
+            # Save video file if needed, stored once per distinct content
+            video_path = ""
+            video_sha256 = None
             if video_option == "Upload Video File" and uploaded_video:
-                with open(video_path, "wb") as f:
-                    f.write(uploaded_video.read())
+                video_path, video_sha256 = store_video(uploaded_video, uploaded_video.name)
 
             # Determine final video source
             video_source = youtube_link if video_option == "YouTube Link" else video_path
 
-            # DB insert
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-
-            # Normalize and check existing player
-            c.execute("SELECT id FROM players WHERE LOWER(name)=? AND LOWER(team)=?", (name.lower(), team.lower()))
-            result = c.fetchone()
-
-            if result:
-                player_id = int(result[0])
-            else:
-                c.execute("INSERT INTO players (name, team, notes) VALUES (?, ?, ?)", (name, team, ""))
-                player_id = int(c.lastrowid)
-
-            # Insert session (CSV path may be None)
-            c.execute('''INSERT INTO sessions 
-                         (player_id, date, session_name, video_source, kinovea_csv, notes)
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (player_id, str(session_date), session_name, video_source, csv_path, notes))
-            conn.commit()
-            conn.close()
-            st.success("✅ Session uploaded!")
+            # DB insert, queued behind any other writes and committed by the writer thread
+            try:
+                with timed("sql", "upload insert"):
+                    session_id = write(save_session, name, team, str(session_date), session_name, video_source,
+                                       video_sha256, csv_path, arrow_path, notes)
+                st.success(f"✅ Session uploaded! (session {session_id})")
+            except Exception as e:
+                st.error(f"Error saving session: {e}")
 
         elif submitted:
             st.warning("⚠️ Please upload a video (YouTube link or file).")
@@ -169,43 +193,49 @@ with tab1:
         elif submitted:
             st.warning("⚠️ Please upload both a CSV and a video or link.")
 
-# === TAB 2: View Sessions ===
-
-with tab2:
+# === VIEW 2: View Sessions ===
+@st.fragment
+def view_sessions_view():
     st.header("View & Analyze Session")
 
-    conn = sqlite3.connect(DB_PATH)
-    player_df = pd.read_sql_query("SELECT * FROM players", conn)
+    with connect() as conn:
+        search_text = st.text_input("Search sessions", placeholder="Session name, notes, player or team",
+                                    key="session_search")
+        results = search_sessions(conn, search_text) if search_text else None
+        if results is not None:
+            if results.empty:
+                st.info("No sessions match your search.")
+            else:
+                picked = st.dataframe(results.drop(columns=["rank"]), hide_index=True, on_select="rerun",
+                                      selection_mode="single-row", key="session_search_results")
+                # Opening a result points the selectboxes below at it
+                rows = picked.selection.rows
+                if rows and st.session_state.get("session_search_opened") != (search_text, rows[0]):
+                    st.session_state["session_search_opened"] = (search_text, rows[0])
+                    result = results.iloc[rows[0]]
+                    st.session_state["view_player"] = result["player"]
+                    st.session_state["view_session"] = f"{result['date']} - {result['session_name']}"
 
-    selected_player = st.selectbox("Select a player", player_df["name"])
-    player_id = int(player_df[player_df["name"] == selected_player]["id"].values[0])
+        player_df = query_df(conn, "SELECT * FROM players")
 
-    session_df = pd.read_sql_query("SELECT * FROM sessions WHERE player_id = ?", conn, params=(player_id,))
+        selected_player = st.selectbox("Select a player", player_df["name"], key="view_player")
+        player_id = int(player_df[player_df["name"] == selected_player]["id"].values[0])
+
+        session_df = query_df(conn, "SELECT * FROM sessions WHERE player_id = ?", (player_id,))
+
+        if session_df.empty:
+            st.warning("No sessions found for this player.")
+            return
 
-    if session_df.empty:
-        st.warning("No sessions found for this player.")
-    else:
         session_df["label"] = session_df["date"] + " - " + session_df["session_name"]
-        selected_session = st.selectbox("Select a session", session_df["label"])
+        selected_session = st.selectbox("Select a session", session_df["label"], key="view_session")
 
         session_match = session_df[session_df["label"] == selected_session]
         if not session_match.empty:
             session_row = session_match.iloc[0]
 
             st.subheader("Video Playback")
-            video_source = session_row["video_source"]
-
-            if video_source.startswith("http"):
-                video_id = extract_youtube_id(video_source)
-                if video_id:
-                    st.video(f"https://www.youtube.com/embed/{video_id}")
-                else:
-                    st.warning("⚠️ Could not extract video ID. Check the YouTube link.")
-            else:
-                if os.path.exists(video_source):
-                    st.video(video_source)
-                else:
-                    st.warning("⚠️ Local video file not found.")
+            show_video(session_row["video_source"], seek_ms=chart_seek_ms("view_plot", session_row["kinovea_csv"]))
 
             st.subheader("Session Notes")
             st.info(session_row["notes"] if session_row["notes"] else "No notes provided.")
@@ -216,18 +246,46 @@ with tab2:
                 st.info("No Kinovea data uploaded for this session.")
             else:
                 try:
-                    kin_df = pd.read_csv(csv_path)
+                    kin_df = load_session_data(csv_path, session_row.get("kinovea_arrow"))
                     st.write(kin_df.head())
 
                     if "Time (ms)" in kin_df.columns:
-                        available_metrics_view = [col for col in kin_df.columns if col in COLOR_MAP]
-                        selected_metrics_view = st.multiselect(
-                            "Select metrics to show",
-                            options=available_metrics_view,
-                            default=available_metrics_view,
-                            key="view_metric_select"
-                        )
-                        plot_custom_lines(kin_df, chart_key="view_plot", selected_metrics=selected_metrics_view)
+                        metric_chart(kin_df, csv_path, "Select metrics to show", "view_metric_select", "view_plot",
+                                     session_row.get("kinovea_arrow"))
+
+                        st.subheader("Kinematic Sequence")
+                        sequence = sequence_metrics(kin_df)
+                        if sequence["proper_sequence"]:
+                            st.success(f"✅ Proper sequence: {sequence['peak_order']}")
+                        else:
+                            st.warning(f"⚠️ Out of sequence: {sequence['peak_order']} (expected FK > FH > TS > TE)")
+                        seq_col1, seq_col2 = st.columns(2)
+                        seq_col1.dataframe(segment_summary(sequence), hide_index=True)
+                        seq_col2.dataframe(transition_summary(sequence), hide_index=True)
+
+                        st.subheader("Percentiles vs Cohort")
+                        team = player_df[player_df["name"] == selected_player]["team"].values[0]
+                        cohort_col, dates_col = st.columns(2)
+                        cohort = cohort_col.radio("Cohort", ["All sessions", f"Team: {team}"], horizontal=True,
+                                                  key="cohort_scope")
+                        cohort_dates = dates_col.date_input("Cohort date range", value=(), key="cohort_dates")
+                        month_from = cohort_dates[0].strftime("%Y-%m") if len(cohort_dates) > 0 else None
+                        month_to = cohort_dates[-1].strftime("%Y-%m") if len(cohort_dates) > 0 else None
+                        st.dataframe(cohort_percentiles(conn, sequence, team if cohort != "All sessions" else None,
+                                                        month_from, month_to), hide_index=True)
+                        st.caption("Cohort date ranges are matched by month.")
+
+                        st.subheader("Similar Deliveries")
+                        k = st.number_input("Sessions to find", min_value=1, max_value=20, value=5,
+                                            key="similar_k")
+                        if st.button("Find similar deliveries", key="find_similar"):
+                            similar = find_similar(conn, kin_df, k=int(k), exclude_id=int(session_row["id"]))
+                            if similar.empty:
+                                st.info("No comparable sessions found.")
+                            else:
+                                st.dataframe(similar, hide_index=True)
+                                st.caption("Shortlisted by distance between resampled curves, "
+                                           "ranked by dynamic time warping (lower is closer).")
                     else:
                         st.warning("Column 'Time (ms)' not found. Plotting by row index.")
                         st.line_chart(kin_df.select_dtypes(include=['float', 'int']))
@@ -235,131 +293,165 @@ with tab2:
                 except Exception as e:
                     st.error(f"Error reading CSV: {e}")
 
-# === TAB 3: Compare Sessions ===
-with tab3:
+        with st.expander("Kinematic sequence across all sessions"):
+            # Sessions whose CSV changed since they were summarized get their
+            # metrics and embeddings queued on the writer without waiting; the
+            # table catches up on a later run
+            pending = st.session_state.get("metrics_refresh")
+            try:
+                if pending is not None and pending.done():
+                    del st.session_state["metrics_refresh"]
+                    pending.result()
+                elif pending is None:
+                    stale = stale_sessions(conn, [(int(row.id), row.kinovea_csv, row.kinovea_arrow)
+                                                  for row in session_df.itertuples()])
+                    if stale:
+                        st.session_state["metrics_refresh"] = submit(refresh_session_summaries, stale)
+                        st.caption(f"Updating metrics of {len(stale)} changed session(s)…")
+            except Exception as e:
+                st.warning(f"Couldn't update session metrics: {e}")
+
+            player_metrics = query_df(
+                conn,
+                '''SELECT s.date || ' - ' || s.session_name AS session, m.*
+                   FROM session_metrics m JOIN sessions s ON s.id = m.session_id
+                   WHERE s.player_id = ? ORDER BY s.date''',
+                (player_id,))
+            if player_metrics.empty:
+                st.info("No Kinovea data uploaded for this player.")
+            else:
+                st.dataframe(player_metrics.drop(columns=["session_id", "csv_sha256", "updated_at"])
+                             .set_index("session"))
+
+# === VIEW 3: Compare Sessions ===
+@st.fragment
+def compare_pane(side, player_df):
+    key = side.lower()
+    st.markdown(f"### {side} Player")
+    player = st.selectbox(f"Select Player ({side})", player_df["name"], key=f"{key}_player")
+    player_id = int(player_df[player_df["name"] == player]["id"].values[0])
+
+    with connect() as conn:
+        sessions = query_df(conn, "SELECT * FROM sessions WHERE player_id = ?", (player_id,))
+
+    if sessions.empty:
+        st.warning("No sessions found for this player.")
+        return
+
+    sessions["label"] = sessions["date"] + " - " + sessions["session_name"]
+    session = st.selectbox(f"Select Session ({side})", sessions["label"], key=f"{key}_session")
+    match = sessions[sessions["label"] == session]
+    if match.empty:
+        return
+
+    row = match.iloc[0]
+    show_video(row["video_source"], side, seek_ms=chart_seek_ms(f"{key}_plot", row.kinovea_csv))
+
+    st.subheader(f"Session Notes ({side})")
+    st.info(row["notes"] if row["notes"] else "No notes provided.")
+
+    csv_path = row.kinovea_csv
+    if not csv_path or not os.path.exists(csv_path):
+        st.info("No Kinovea data uploaded for this session.")
+    else:
+        try:
+            df = load_session_data(csv_path, row.get("kinovea_arrow"))
+            if "Time (ms)" in df.columns:
+                metric_chart(df, csv_path, f"Select metrics to show ({side})", f"metric_select_{key}", f"{key}_plot",
+                             row.get("kinovea_arrow"))
+            else:
+                st.warning(f"Column 'Time (ms)' not found in {key} session.")
+                st.line_chart(df.select_dtypes(include=['float', 'int']))
+        except Exception as e:
+            st.error(f"Error reading {key} CSV: {e}")
+
+@st.fragment
+def overlay_section(player_df):
+    st.subheader("Overlay Sessions Aligned on an Event")
+
+    with connect() as conn:
+        overlay_sessions = query_df(
+            conn,
+            '''SELECT s.id, s.player_id, s.date, s.session_name, s.kinovea_csv, s.kinovea_arrow, p.name
+               FROM sessions s JOIN players p ON p.id = s.player_id
+               WHERE s.kinovea_csv IS NOT NULL ORDER BY s.date DESC''')
+
+    if overlay_sessions.empty:
+        st.info("No sessions with Kinovea data to overlay.")
+        return
+
+    overlay_sessions["label"] = (overlay_sessions["name"] + " - " + overlay_sessions["date"] + " - "
+                                 + overlay_sessions["session_name"])
+
+    overlay_player = st.selectbox("Player", ["All players"] + player_df["name"].tolist(), key="overlay_player")
+    if overlay_player != "All players":
+        overlay_player_id = int(player_df[player_df["name"] == overlay_player]["id"].values[0])
+        overlay_sessions = overlay_sessions[overlay_sessions["player_id"] == overlay_player_id]
+
+    # Default to the player's most recent sessions
+    selected_overlay = st.multiselect(
+        "Sessions to overlay",
+        options=overlay_sessions["label"],
+        default=overlay_sessions["label"].head(20).tolist() if overlay_player != "All players" else [],
+        key=f"overlay_sessions_{overlay_player}"
+    )
+
+    ov_col1, ov_col2, ov_col3 = st.columns(3)
+    overlay_metric = ov_col1.selectbox("Metric", list(COLOR_MAP), key="overlay_metric")
+    align_segment = ov_col2.selectbox("Align on peak speed of", SEGMENTS, index=SEGMENTS.index("FH"),
+                                      key="overlay_event")
+    overlay_window = ov_col3.slider("Window around event (ms)", -1500, 1500, (-400, 200), step=50,
+                                    key="overlay_window")
+
+    if selected_overlay:
+        chosen = overlay_sessions[overlay_sessions["label"].isin(selected_overlay)]
+        frames, labels = [], []
+        for row in chosen.itertuples():
+            if not os.path.exists(row.kinovea_csv):
+                continue
+            try:
+                frames.append(load_session_data(row.kinovea_csv, row.kinovea_arrow))
+                labels.append(row.label)
+            except Exception as e:
+                st.error(f"Error reading CSV for {row.label}: {e}")
+
+        if frames:
+            grid, curves = align_sessions(frames, overlay_metric, align_segment, overlay_window)
+            usable = ~np.isnan(curves).all(axis=1)
+            if (~usable).any():
+                st.warning(f"⚠️ {int((~usable).sum())} session(s) have no {overlay_metric} data or no "
+                           f"{align_segment} peak in this window and were left out.")
+            if usable.any():
+                plot_aligned_overlay(grid, curves[usable], [l for l, u in zip(labels, usable) if u],
+                                     overlay_metric, f"peak {align_segment}")
+
+def compare_view():
     st.header("Compare Two Sessions Side-by-Side")
 
-    conn = sqlite3.connect(DB_PATH)
-    player_df = pd.read_sql_query("SELECT * FROM players", conn)
+    with connect() as conn:
+        player_df = query_df(conn, "SELECT * FROM players")
 
     col1, col2 = st.columns(2)
 
     # === LEFT SESSION ===
     with col1:
-        st.markdown("### Left Player")
-        player_left = st.selectbox("Select Player (Left)", player_df["name"], key="left_player")
-        player_left_id = int(player_df[player_df["name"] == player_left]["id"].values[0])
-        left_sessions = pd.read_sql_query("SELECT * FROM sessions WHERE player_id = ?", conn, params=(player_left_id,))
-
-        if left_sessions.empty:
-            st.warning("No sessions found for this player.")
-        else:
-            left_sessions["label"] = left_sessions["date"] + " - " + left_sessions["session_name"]
-            session_left = st.selectbox("Select Session (Left)", left_sessions["label"], key="left_session")
-            left_match = left_sessions[left_sessions["label"] == session_left]
-            if not left_match.empty:
-                left_row = left_match.iloc[0]
-                video_source = left_row["video_source"]
-
-                if video_source.startswith("http"):
-                    video_id = extract_youtube_id(video_source)
-                    if video_id:
-                        st.video(f"https://www.youtube.com/embed/{video_id}")
-                    else:
-                        st.warning("⚠️ Invalid YouTube link for left session.")
-                else:
-                    if os.path.exists(video_source):
-                        st.video(video_source)
-                    else:
-                        st.warning("⚠️ Local video file not found for left session.")
-
-                st.subheader("Session Notes (Left)")
-                st.info(left_row["notes"] if left_row["notes"] else "No notes provided.")
-
-                csv_path_left = left_row.kinovea_csv
-                if not csv_path_left or not os.path.exists(csv_path_left):
-                    st.info("No Kinovea data uploaded for this session.")
-                else:
-                    try:
-                        df_left = pd.read_csv(csv_path_left)
-                        if "Time (ms)" in df_left.columns:
-                            available_metrics_left = [col for col in df_left.columns if col in COLOR_MAP]
-                            selected_left_metrics = st.multiselect(
-                                "Select metrics to show (Left)",
-                                options=available_metrics_left,
-                                default=available_metrics_left,
-                                key="metric_select_left"
-                            )
-                            plot_custom_lines(df_left, chart_key="left_plot", selected_metrics=selected_left_metrics)
-                        else:
-                            st.warning("Column 'Time (ms)' not found in left session.")
-                            st.line_chart(df_left.select_dtypes(include=['float', 'int']))
-                    except Exception as e:
-                        st.error(f"Error reading left CSV: {e}")
+        compare_pane("Left", player_df)
 
     # === RIGHT SESSION ===
     with col2:
-        st.markdown("### Right Player")
-        player_right = st.selectbox("Select Player (Right)", player_df["name"], key="right_player")
-        player_right_id = int(player_df[player_df["name"] == player_right]["id"].values[0])
-        right_sessions = pd.read_sql_query("SELECT * FROM sessions WHERE player_id = ?", conn, params=(player_right_id,))
+        compare_pane("Right", player_df)
 
-        if right_sessions.empty:
-            st.warning("No sessions found for this player.")
-        else:
-            right_sessions["label"] = right_sessions["date"] + " - " + right_sessions["session_name"]
-            session_right = st.selectbox("Select Session (Right)", right_sessions["label"], key="right_session")
-            right_match = right_sessions[right_sessions["label"] == session_right]
-            if not right_match.empty:
-                right_row = right_match.iloc[0]
-                video_source = right_row["video_source"]
-
-                if video_source.startswith("http"):
-                    video_id = extract_youtube_id(video_source)
-                    if video_id:
-                        st.video(f"https://www.youtube.com/embed/{video_id}")
-                    else:
-                        st.warning("⚠️ Invalid YouTube link for right session.")
-                else:
-                    if os.path.exists(video_source):
-                        st.video(video_source)
-                    else:
-                        st.warning("⚠️ Local video file not found for right session.")
-
-                st.subheader("Session Notes (Right)")
-                st.info(right_row["notes"] if right_row["notes"] else "No notes provided.")
-
-                csv_path_right = right_row.kinovea_csv
-                if not csv_path_right or not os.path.exists(csv_path_right):
-                    st.info("No Kinovea data uploaded for this session.")
-                else:
-                    try:
-                        df_right = pd.read_csv(csv_path_right)
-                        if "Time (ms)" in df_right.columns:
-                            available_metrics_right = [col for col in df_right.columns if col in COLOR_MAP]
-                            selected_right_metrics = st.multiselect(
-                                "Select metrics to show (Right)",
-                                options=available_metrics_right,
-                                default=available_metrics_right,
-                                key="metric_select_right"
-                            )
-                            plot_custom_lines(df_right, chart_key="right_plot", selected_metrics=selected_right_metrics)
-                        else:
-                            st.warning("Column 'Time (ms)' not found in right session.")
-                            st.line_chart(df_right.select_dtypes(include=['float', 'int']))
-                    except Exception as e:
-                        st.error(f"Error reading right CSV: {e}")
-
-# === TAB 4: Admin Tools ===
-with tab4:
-    with st.expander(" Admin Tools"):
-        st.subheader("Delete Players or Sessions")
+    # === OVERLAY: N sessions aligned on an event ===
+    st.markdown("---")
+    overlay_section(player_df)
 
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+# === VIEW 4: Admin Tools ===
+@st.fragment
+def admin_view():
+    with st.expander(" Admin Tools"), connect() as conn:
+        st.subheader("Delete Players or Sessions")
 
-        players_df = pd.read_sql("SELECT * FROM players", conn)
-        sessions_df = pd.read_sql("SELECT * FROM sessions", conn)
+        players_df = query_df(conn, "SELECT id, name FROM players ORDER BY id")
 
         # ---- Delete a Session ----
         st.markdown("### Delete a Session")
@@ -368,7 +460,7 @@ with tab4:
                                              key="admin_player_select")
         admin_player_id = int(players_df[players_df["name"] == selected_admin_player]["id"].values[0])
 
-        player_sessions_df = pd.read_sql("SELECT * FROM sessions WHERE player_id = ?", conn, params=(admin_player_id,))
+        player_sessions_df = query_df(conn, "SELECT * FROM sessions WHERE player_id = ?", (admin_player_id,))
         player_sessions_df["label"] = player_sessions_df["date"] + " - " + player_sessions_df["session_name"]
 
         if player_sessions_df.empty:
@@ -380,16 +472,28 @@ with tab4:
             if st.button(" Delete Selected Session"):
                 session_row = player_sessions_df[player_sessions_df["label"] == session_to_delete].iloc[0]
                 csv_path = session_row["kinovea_csv"]
+                arrow_path = session_row.get("kinovea_arrow")
                 video_source = session_row["video_source"]
+                video_sha256 = session_row.get("video_sha256")
 
                 try:
+                    # Identical uploads share one video file, keep it while other sessions use it.
+                    # Videos stored before hashing have no hash yet, so a shared path counts too.
+                    video_shared = bool(query_rows(
+                        conn, "SELECT 1 FROM sessions WHERE (video_sha256 = ? OR video_source = ?) AND id != ? LIMIT 1",
+                        (video_sha256, video_source, int(session_row["id"])), label="shared video check"))
+
                     if csv_path and os.path.exists(csv_path):
                         os.remove(csv_path)
-                    if video_source and not video_source.startswith("http") and os.path.exists(video_source):
+                    if arrow_path and os.path.exists(arrow_path):
+                        os.remove(arrow_path)
+                    if csv_path and os.path.exists(derived_path_for(csv_path)):
+                        os.remove(derived_path_for(csv_path))
+                    if (video_source and not video_source.startswith("http") and not video_shared
+                            and os.path.exists(video_source)):
                         os.remove(video_source)
 
-                    c.execute("DELETE FROM sessions WHERE id = ?", (session_row["id"],))
-                    conn.commit()
+                    write(delete_sessions, [session_row["id"]])
 
                     st.success(f"✅ Deleted session: {session_to_delete}")
                     st.rerun()
@@ -404,17 +508,19 @@ with tab4:
         selected_player = st.selectbox("Select a player to delete", player_names, key="delete_player")
         player_row = players_df[players_df["name"] == selected_player].iloc[0]
 
-        player_sessions = sessions_df[sessions_df["player_id"] == player_row["id"]]
+        has_sessions = query_rows(conn, "SELECT EXISTS (SELECT 1 FROM sessions WHERE player_id = ?)",
+                                  (int(player_row["id"]),), label="player has sessions")[0][0]
 
-        if not player_sessions.empty:
+        if has_sessions:
             st.warning("This player has sessions and cannot be deleted. Please delete all their sessions first.")
         else:
             if st.button(" Delete Selected Player"):
                 try:
-                    c.execute("DELETE FROM players WHERE id = ?", (player_row["id"],))
-                    conn.commit()
-                    st.success("✅ Player deleted successfully.")
-                    st.rerun()
+                    if write(delete_player, player_row["id"]):
+                        st.success("✅ Player deleted successfully.")
+                        st.rerun()
+                    else:
+                        st.warning("This player was given a session in the meantime and was not deleted.")
                 except Exception as e:
                     st.error(f"Error deleting player: {e}")
 
@@ -424,23 +530,10 @@ with tab4:
 
         if st.button("Remove Sessions with Missing CSVs or Local Videos"):
             removed_count = 0
-            sessions_df = pd.read_sql("SELECT * FROM sessions", conn)
-
-            for _, row in sessions_df.iterrows():
-                csv_path = row["kinovea_csv"]
-                video_source = row["video_source"]
-
-                missing_csv = csv_path and isinstance(csv_path, str) and not os.path.exists(csv_path)
-                is_local_video = video_source and not video_source.startswith("http")
-                missing_video = is_local_video and not os.path.exists(video_source)
-
-                if missing_csv or missing_video:
-                    try:
-                        c.execute("DELETE FROM sessions WHERE id = ?", (row["id"],))
-                        conn.commit()
-                        removed_count += 1
-                    except Exception as e:
-                        st.error(f" Error deleting session {row['session_name']}: {e}")
+            try:
+                removed_count = write(delete_sessions, find_broken_sessions(conn))
+            except Exception as e:
+                st.error(f" Error deleting broken sessions: {e}")
 
             if removed_count > 0:
                 st.success(f"✅ Removed {removed_count} broken session(s) with missing CSV or local video.")
@@ -453,18 +546,11 @@ with tab4:
         st.subheader(" Clean Up Players With No Sessions")
 
         if st.button("Remove Players With No Sessions"):
-            orphaned_players = pd.read_sql(
-                "SELECT * FROM players WHERE id NOT IN (SELECT DISTINCT player_id FROM sessions)",
-                conn
-            )
             count = 0
-            for _, row in orphaned_players.iterrows():
-                try:
-                    c.execute("DELETE FROM players WHERE id = ?", (row["id"],))
-                    conn.commit()
-                    count += 1
-                except Exception as e:
-                    st.error(f"Error deleting player {row['name']}: {e}")
+            try:
+                count = write(delete_orphan_players)
+            except Exception as e:
+                st.error(f"Error deleting players: {e}")
 
             if count > 0:
                 st.success(f"✅ Removed {count} player(s) with no sessions.")
@@ -472,14 +558,133 @@ with tab4:
             else:
                 st.info("No players without sessions found.")
 
+        # ---- Video Index ----
+        st.markdown("---")
+        st.subheader(" Local Video Index")
+
+        if st.button("Re-index Changed Local Videos"):
+            try:
+                st.success(f"✅ Indexed {write(refresh_all_video_metadata)} video(s).")
+            except Exception as e:
+                st.error(f"Error indexing videos: {e}")
+
+        indexed, failed = query_rows(conn, "SELECT COUNT(*), COUNT(error) FROM video_metadata",
+                                     label="video index counts")[0]
+        st.write(f"{indexed - failed} local video(s) indexed, {failed} could not be read as mp4/mov.")
+
+        # ---- Clean Up Orphaned Files ----
+        st.markdown("---")
+        st.subheader(" Clean Up Files Not Used by Any Session")
+
+        if st.button("Find Orphaned Files"):
+            st.session_state["orphan_files"] = find_orphan_files(conn)
+
+        orphan_files = st.session_state.get("orphan_files")
+        if orphan_files is not None:
+            if not orphan_files:
+                st.info("No orphaned files found.")
+            else:
+                st.write(f"{len(orphan_files)} file(s) in `{DATA_DIR}/` and `{VIDEO_DIR}/` are not referenced by any session:")
+                st.dataframe(pd.DataFrame({"File": orphan_files}), hide_index=True)
+                if st.button(f" Delete {len(orphan_files)} Orphaned File(s)"):
+                    # Files a session started using since the list was made are kept
+                    removed = delete_orphan_files(conn, orphan_files)
+                    del st.session_state["orphan_files"]
+                    st.success(f"✅ Removed {removed} orphaned file(s).")
+
+def timings_panel():
+    timings = pd.DataFrame(run_timings(), columns=["kind", "label", "ms"])
+    with st.sidebar:
+        st.subheader(" Rerun Timings")
+        st.metric("Total rerun", f"{run_elapsed_ms():.0f} ms")
+        if timings.empty:
+            st.info("Nothing timed in this rerun.")
+        else:
+            st.dataframe(timings.groupby("kind")["ms"].agg(["count", "sum"]).round(1))
+            st.dataframe(timings.sort_values("ms", ascending=False), hide_index=True)
+        st.caption("Widget changes inside a view rerun only that part of the page and are not timed here.")
+        st.checkbox("Also write timings to the server log", value=False, key="log_timings")
+
+@st.fragment
+def raw_database_browser():
+    with connect() as conn:
+        teams = team_names(conn)
+
+        st.subheader(" Sessions Table")
+        col1, col2, col3 = st.columns(3)
+        player_filter = col1.text_input("Player name contains", key="raw_player")
+        team_filter = col2.selectbox("Team", ["All"] + teams, key="raw_team")
+        date_range = col3.date_input("Date range", value=(), key="raw_dates")
+
+        col4, col5, col6, col7 = st.columns(4)
+        has_csv = col4.selectbox("Has CSV", ["Any", "Yes", "No"], key="raw_has_csv")
+        has_video = col5.selectbox("Has video", ["Any", "Yes", "No"], key="raw_has_video")
+        sort = col6.selectbox("Sort by", list(SESSION_SORTS), key="raw_sort")
+        descending = col7.checkbox("Descending", value=True, key="raw_desc")
+
+        date_from = date_range[0] if len(date_range) > 0 else None
+        date_to = date_range[1] if len(date_range) > 1 else date_from
+        team = None if team_filter == "All" else team_filter
+        filters = session_filters(player_filter, team, date_from, date_to,
+                                  {"Any": None, "Yes": True, "No": False}[has_csv],
+                                  {"Any": None, "Yes": True, "No": False}[has_video])
+
+        # Cursors of the pages before the current one; any filter change starts over at page 1
+        state_key = (repr(filters), sort, descending)
+        if st.session_state.get("raw_sessions_key") != state_key:
+            st.session_state["raw_sessions_key"] = state_key
+            st.session_state["raw_sessions_cursors"] = [None]
+        cursors = st.session_state["raw_sessions_cursors"]
+
+        sessions_page, next_cursor = fetch_sessions_page(conn, filters, sort, descending, after=cursors[-1])
+        st.dataframe(sessions_page, hide_index=True)
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("◀ Prev", key="raw_sessions_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun(scope="fragment")
+        page_col.caption(f"Page {len(cursors)} · {len(sessions_page)} session(s)")
+        if next_col.button("Next ▶", key="raw_sessions_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun(scope="fragment")
+
+        st.subheader(" Players Table")
+        players_key = (player_filter, team)
+        if st.session_state.get("raw_players_key") != players_key:
+            st.session_state["raw_players_key"] = players_key
+            st.session_state["raw_players_cursors"] = [None]
+        player_cursors = st.session_state["raw_players_cursors"]
+
+        players_page, next_player = fetch_players_page(conn, player_filter, team, after_id=player_cursors[-1])
+        st.dataframe(players_page, hide_index=True)
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("◀ Prev", key="raw_players_prev", disabled=len(player_cursors) == 1):
+            player_cursors.pop()
+            st.rerun(scope="fragment")
+        page_col.caption(f"Page {len(player_cursors)} · {len(players_page)} player(s)")
+        if next_col.button("Next ▶", key="raw_players_next", disabled=next_player is None):
+            player_cursors.append(next_player)
+            st.rerun(scope="fragment")
+
+VIEWS = {
+    " Upload Session": upload_view,
+    " View Sessions": view_sessions_view,
+    " Compare Sessions": compare_view,
+    "Admin": admin_view,
+}
+
+# === Title ===
+st.title(" Pitcher Biomechanics Tracker")
+
+# === Navigation: only the selected view queries and renders ===
+active_view = st.radio("View", list(VIEWS), horizontal=True, label_visibility="collapsed", key="active_view")
+VIEWS[active_view]()
+
 # === Debug: Show raw tables ===
 if st.checkbox(" Show Raw Database (Players + Sessions)", value=False):
-    conn = sqlite3.connect(DB_PATH)
-    players = pd.read_sql("SELECT * FROM players", conn)
-    sessions = pd.read_sql("SELECT * FROM sessions", conn)
-    st.subheader(" Players Table")
-    st.dataframe(players)
-    st.subheader(" Sessions Table")
-    st.dataframe(sessions)
+    raw_database_browser()
+
+# === Debug: Show per-rerun timings ===
+if st.checkbox(" Show Timings (SQL, CSV, Charts)", value=False, key="show_timings"):
+    timings_panel()
 
 
@@ -0,0 +1,305 @@
+"""
+Benchmarks for the app's hot paths on synthetic data, no browser needed.
+
+    python benchmark.py --sessions 1000 --output results.json
+    python benchmark.py --sessions 100000 --players 2000 --root /tmp/bench
+
+The generator fills <root>/pitcher_biomech.db and <root>/data/ with players,
+sessions and Kinovea-format CSVs (plus their columnar copies and session
+metrics, as uploads produce them), then each path is timed and the results
+are written as JSON. An existing root is reused when it already holds the
+requested number of sessions, use --regenerate to rebuild it. Only roots the
+generator created (marked with a BENCHMARK_MARKER file) are ever reused or
+deleted; any other non-empty directory is refused.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics import SEGMENTS
+from charts import build_custom_lines_figure
+from db import DB_PATH, close_all, connect, get_or_create_player
+from kinovea import TIME_COL, clear_cache, load_kinovea_csv, load_session_data, write_columnar_copy
+from maintenance import delete_sessions, find_broken_sessions, find_orphan_files
+from migrate_sessions_schema import run_migrations
+from session_metrics import refresh_all_session_metrics
+from signals import compute_derived_channels
+from similarity import find_similar, refresh_all_session_embeddings
+from storage import DATA_DIR, VIDEO_DIR
+from synthetic_video import synthetic_mp4
+from uploads import save_session
+from writer import write
+
+TEAMS = ["ATU 2025", "ATU 2026", "Org B", "Org C", "Summer League"]
+
+# Mean time of peak speed (ms after the start of the delivery) per segment,
+# in proximal-to-distal order, roughly matching the sample captures.
+PEAK_OFFSETS = {"FK": 0, "FH": 40, "TS": 170, "TE": 210}
+PEAK_SPEEDS = {"FK": 280, "FH": 200, "TS": 450, "TE": 850}
+
+# Written into every generated root; a root without it is never deleted
+BENCHMARK_MARKER = ".biomech_benchmark"
+
+
+# === Synthetic data ===
+
+def synthetic_capture(rng, n_samples):
+    """One Kinovea-like capture: bell-shaped segment speeds peaking in sequence plus noise."""
+    start = float(rng.integers(500, 6000))
+    interval = float(rng.choice([33.0, 33.4, 41.0]))
+    t = start + interval * np.arange(n_samples)
+    release = start + interval * n_samples * rng.uniform(0.45, 0.65)
+
+    data = {TIME_COL: t}
+    for seg in SEGMENTS:
+        peak = release + PEAK_OFFSETS[seg] + rng.normal(0, 15)
+        height = PEAK_SPEEDS[seg] * rng.uniform(0.7, 1.3)
+        width = rng.uniform(40, 90)
+        data[seg] = height * np.exp(-0.5 * ((t - peak) / width) ** 2) + np.abs(rng.normal(5, 3, n_samples))
+
+    if rng.random() < 0.2:
+        for col, base in (("Angle 1 - o", 30), ("Angle 1 - a", 95), ("Angle 1 - b", 60)):
+            data[col] = base + 20 * np.sin((t - start) / 300) + rng.normal(0, 2, n_samples)
+    return data
+
+
+def write_kinovea_csv(path, data, rng):
+    # Kinovea quotes every value and the metric column order varies between exports
+    metrics = [col for col in data if col != TIME_COL]
+    rng.shuffle(metrics)
+    columns = [TIME_COL] + metrics
+    values = np.column_stack([data[col] for col in columns])
+    with open(path, "w") as f:
+        f.write(",".join(f'"{col}"' for col in columns) + "\n")
+        for row in values:
+            f.write(f'"{int(row[0])}",' + ",".join(f'"{v:.6g}"' for v in row[1:]) + "\n")
+
+
+def generate(root, n_sessions, n_players, samples=(150, 600), seed=0):
+    """Creates a database and data directory with synthetic players and sessions under root."""
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    os.makedirs(root, exist_ok=True)
+    open(os.path.join(root, BENCHMARK_MARKER), "w").close()
+    os.makedirs(os.path.join(root, DATA_DIR), exist_ok=True)
+    os.makedirs(os.path.join(root, VIDEO_DIR), exist_ok=True)
+
+    with connect(os.path.join(root, DB_PATH)) as conn:
+        run_migrations(conn)
+        c = conn.cursor()
+        c.execute("BEGIN")
+        player_ids = [get_or_create_player(c, f"Pitcher {i:05d}", random.choice(TEAMS)) for i in range(n_players)]
+
+        first_day = date(2024, 1, 1)
+        rows = []
+        for i in range(n_sessions):
+            csv_rel = f"{DATA_DIR}/session_{i:06d}.csv"
+            write_kinovea_csv(os.path.join(root, csv_rel), synthetic_capture(rng, int(rng.integers(*samples))), rng)
+            # Half of the videos are local files, one in fifty of them missing
+            if i % 2:
+                video = f"https://youtu.be/{i:011d}"
+            else:
+                video = f"{VIDEO_DIR}/video_{i:06d}.mp4"
+                if i % 100:
+                    open(os.path.join(root, video), "wb").close()
+            rows.append((random.choice(player_ids), str(first_day + timedelta(days=int(rng.integers(0, 700)))),
+                         f"Bullpen {i}", video, csv_rel, ""))
+        c.executemany('''INSERT INTO sessions (player_id, date, session_name, video_source, kinovea_csv, notes)
+                         VALUES (?, ?, ?, ?, ?, ?)''', rows)
+        conn.commit()
+
+    # Columnar copies and metrics are built the way uploads build them
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        with connect(DB_PATH) as conn:
+            for session_id, csv_path in conn.execute("SELECT id, kinovea_csv FROM sessions").fetchall():
+                conn.execute("UPDATE sessions SET kinovea_arrow = ? WHERE id = ?",
+                             (write_columnar_copy(csv_path), session_id))
+            refresh_all_session_metrics(conn)
+            refresh_all_session_embeddings(conn)
+            conn.commit()
+    finally:
+        os.chdir(cwd)
+
+
+# === Timing ===
+
+def timed(fn, repeat, cleanup=None):
+    """
+    Runs fn repeat times and returns timing stats in milliseconds. cleanup,
+    if given, is called untimed with each result.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - start) * 1000)
+        if cleanup:
+            cleanup(result)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(times), 3),
+        "median_ms": round(statistics.median(times), 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "max_ms": round(max(times), 3),
+    }
+
+
+def run_benchmarks(repeat=20, seed=0):
+    """Times each hot path against the database in the current directory."""
+    rng = random.Random(seed)
+    results = {}
+
+    with connect(DB_PATH) as conn:
+        # A reused root may predate newer migrations
+        run_migrations(conn)
+        players = pd.read_sql_query("SELECT id, name, team FROM players", conn)
+        sessions = pd.read_sql_query("SELECT id, kinovea_csv, kinovea_arrow FROM sessions", conn)
+        sample = list(sessions.sample(n=min(repeat, len(sessions)), random_state=seed).itertuples())
+
+        def pick_player():
+            return players.iloc[rng.randrange(len(players))]
+
+        results["sql_players_all"] = timed(lambda: pd.read_sql_query("SELECT * FROM players", conn), repeat)
+        results["sql_sessions_by_player"] = timed(lambda: pd.read_sql_query(
+            "SELECT * FROM sessions WHERE player_id = ?", conn, params=(int(pick_player()["id"]),)), repeat)
+
+        def dedup_lookup():
+            player = pick_player()
+            conn.execute("SELECT id FROM players WHERE LOWER(name)=? AND LOWER(team)=?",
+                         (player["name"].lower(), player["team"].lower())).fetchone()
+        results["sql_player_dedup_lookup"] = timed(dedup_lookup, repeat)
+
+        results["sql_player_metrics"] = timed(lambda: pd.read_sql_query(
+            '''SELECT s.date, m.* FROM session_metrics m JOIN sessions s ON s.id = m.session_id
+               WHERE s.player_id = ?''', conn, params=(int(pick_player()["id"]),)), repeat)
+
+        # CSV loading: cold parses clear the LRU cache first
+        def csv_cold():
+            clear_cache()
+            row = sample[rng.randrange(len(sample))]
+            load_kinovea_csv(row.kinovea_csv)
+
+        def columnar_cold():
+            clear_cache()
+            row = sample[rng.randrange(len(sample))]
+            load_session_data(row.kinovea_csv, row.kinovea_arrow)
+
+        warm_row = sample[0]
+        results["csv_load_cold"] = timed(csv_cold, repeat)
+        results["columnar_load_cold"] = timed(columnar_cold, repeat)
+        load_kinovea_csv(warm_row.kinovea_csv)
+        results["csv_load_cached"] = timed(lambda: load_kinovea_csv(warm_row.kinovea_csv), repeat)
+
+        warm_df = load_kinovea_csv(warm_row.kinovea_csv)
+        results["figure_build"] = timed(lambda: build_custom_lines_figure(warm_df), repeat)
+        long_df = pd.concat([warm_df] * 50, ignore_index=True)
+        long_df[TIME_COL] = np.arange(len(long_df), dtype=np.float32) * 4
+        results["figure_build_long_capture"] = timed(lambda: build_custom_lines_figure(long_df), repeat)
+        results["derived_channels"] = timed(lambda: compute_derived_channels(warm_df), repeat)
+        results["derived_channels_long_capture"] = timed(lambda: compute_derived_channels(long_df), repeat)
+        results["figure_to_json"] = timed(lambda: build_custom_lines_figure(warm_df).to_json(), repeat)
+
+        results["similar_sessions"] = timed(lambda: find_similar(conn, warm_df, exclude_id=warm_row.id), repeat)
+
+        # Admin cleanup scans are slow at scale, so they run fewer times
+        admin_repeat = max(1, repeat // 5)
+        results["admin_find_broken_sessions"] = timed(lambda: find_broken_sessions(conn), admin_repeat)
+        results["admin_find_orphan_files"] = timed(lambda: find_orphan_files(conn), admin_repeat)
+        # The Admin tab's broken session removal, rolled back after each run
+        results["admin_remove_broken_sessions"] = timed(
+            lambda: delete_sessions(conn, find_broken_sessions(conn)), admin_repeat, cleanup=lambda _: conn.rollback())
+
+        # The app's upload insert on the writer thread: player upsert, session
+        # row, metrics, embedding and video index. Each new session and its
+        # video are deleted again, untimed, so repeated runs see the same data.
+        # 10 s at 30 fps, a keyframe every second
+        video_header = synthetic_mp4(timescale=3000, runs=((300, 100),), sync=range(1, 301, 30), size=(1280, 720))
+        uploads = itertools.count()
+
+        def upload_insert():
+            player = pick_player()
+            video = os.path.join(VIDEO_DIR, f"upload_{next(uploads):06d}.mp4")
+            with open(video, "wb") as f:
+                f.write(video_header)
+            return write(save_session, player["name"], player["team"], "2025-01-01", "bench", video, None,
+                         warm_row.kinovea_csv, warm_row.kinovea_arrow, "", db_path=DB_PATH), video
+
+        def remove_upload(result):
+            session_id, video = result
+            write(delete_sessions, [session_id], db_path=DB_PATH)
+            os.remove(video)
+        results["upload_insert"] = timed(upload_insert, repeat, cleanup=remove_upload)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app hot paths on synthetic data.")
+    parser.add_argument("--root", default="benchmark_env", help="directory for the synthetic DB and data/")
+    parser.add_argument("--sessions", type=int, default=1000, help="number of sessions to generate")
+    parser.add_argument("--players", type=int, default=None, help="number of players (default: sessions / 20)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the synthetic data even if it exists")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    n_players = args.players or max(1, args.sessions // 20)
+    root = os.path.abspath(args.root)
+    output = os.path.abspath(args.output) if args.output else None
+
+    generated = os.path.exists(os.path.join(root, BENCHMARK_MARKER))
+    if not generated and os.path.isdir(root) and os.listdir(root):
+        parser.error(f"{root} is not empty and was not created by this benchmark, refusing to use it")
+
+    existing = 0
+    if generated and os.path.exists(os.path.join(root, DB_PATH)) and not args.regenerate:
+        with connect(os.path.join(root, DB_PATH)) as conn:
+            existing = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    generate_s = None
+    if existing != args.sessions:
+        if generated:
+            close_all()
+            shutil.rmtree(root)
+        start = time.perf_counter()
+        generate(root, args.sessions, n_players, seed=args.seed)
+        generate_s = round(time.perf_counter() - start, 2)
+
+    os.chdir(root)
+    report = {
+        "meta": {
+            "sessions": args.sessions,
+            "players": n_players,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "generate_s": generate_s,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run_benchmarks(repeat=args.repeat, seed=args.seed),
+    }
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
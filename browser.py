@@ -0,0 +1,106 @@
+from db import query_df, query_rows
+
+PAGE_SIZE = 50
+
+# Sort choices for the sessions browser. Every sort is tie-broken on s.id so
+# (sort value, id) identifies a row and can serve as the keyset cursor.
+SESSION_SORTS = {
+    "Date": "COALESCE(s.date, '')",
+    "Player": "COALESCE(p.name, '')",
+    "Team": "COALESCE(p.team, '')",
+    "Session ID": "s.id",
+}
+
+SESSION_COLUMNS = '''s.id, p.name AS player, p.team, s.date, s.session_name, s.video_source,
+    s.kinovea_csv, s.kinovea_arrow, s.video_sha256, s.notes'''
+
+
+def session_filters(player=None, team=None, date_from=None, date_to=None, has_csv=None, has_video=None):
+    """
+    Builds the WHERE clause and parameters for the sessions browser. player is a
+    case-insensitive substring, team an exact match, dates are inclusive, and
+    has_csv / has_video are True, False or None for either.
+    """
+    clauses, params = [], []
+    if player:
+        clauses.append("LOWER(p.name) LIKE ?")
+        params.append(f"%{player.lower()}%")
+    if team:
+        clauses.append("p.team = ?")
+        params.append(team)
+    if date_from:
+        clauses.append("s.date >= ?")
+        params.append(str(date_from))
+    if date_to:
+        clauses.append("s.date <= ?")
+        params.append(str(date_to))
+    if has_csv is not None:
+        clauses.append("s.kinovea_csv IS NOT NULL" if has_csv else "s.kinovea_csv IS NULL")
+    if has_video is not None:
+        has_video_sql = "(s.video_source IS NOT NULL AND s.video_source != '')"
+        clauses.append(has_video_sql if has_video else f"NOT {has_video_sql}")
+    return clauses, params
+
+
+def fetch_sessions_page(conn, filters, sort="Date", descending=True, after=None, page_size=PAGE_SIZE):
+    """
+    Returns (page, next_cursor) for the sessions browser using keyset
+    pagination: only page_size rows are read, however deep the page. after is
+    the cursor returned for the previous page; next_cursor is None on the last.
+    """
+    clauses, params = list(filters[0]), list(filters[1])
+    sort_sql = SESSION_SORTS[sort]
+    direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+
+    if after is not None:
+        clauses.append(f"({sort_sql}, s.id) {compare} (?, ?)")
+        params += list(after)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f'''SELECT {SESSION_COLUMNS}, {sort_sql} AS sort_key
+              FROM sessions s LEFT JOIN players p ON p.id = s.player_id
+              {where}
+              ORDER BY sort_key {direction}, s.id {direction}
+              LIMIT ?'''
+    page = query_df(conn, sql, params + [page_size + 1], label=f"sessions page by {sort}")
+
+    # One extra row tells us whether there is a next page
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        sort_key = page.iloc[-1]["sort_key"]
+        next_cursor = (sort_key.item() if hasattr(sort_key, "item") else sort_key, int(page.iloc[-1]["id"]))
+    return page.drop(columns=["sort_key"]), next_cursor
+
+
+def fetch_players_page(conn, name=None, team=None, after_id=None, page_size=PAGE_SIZE):
+    """Keyset-paginated players with their session counts, ordered by id."""
+    clauses, params = [], []
+    if name:
+        clauses.append("LOWER(p.name) LIKE ?")
+        params.append(f"%{name.lower()}%")
+    if team:
+        clauses.append("p.team = ?")
+        params.append(team)
+    if after_id is not None:
+        clauses.append("p.id > ?")
+        params.append(int(after_id))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f'''SELECT p.id, p.name, p.team, p.notes,
+                     (SELECT COUNT(*) FROM sessions s WHERE s.player_id = p.id) AS sessions
+              FROM players p {where}
+              ORDER BY p.id LIMIT ?'''
+    page = query_df(conn, sql, params + [page_size + 1], label="players page")
+
+    next_cursor = None
+    if len(page) > page_size:
+        page = page.iloc[:page_size]
+        next_cursor = int(page.iloc[-1]["id"])
+    return page, next_cursor
+
+
+def team_names(conn):
+    rows = query_rows(conn, "SELECT DISTINCT team FROM players WHERE team IS NOT NULL ORDER BY team",
+                      label="team names")
+    return [row[0] for row in rows]
@@ -0,0 +1,229 @@
+"""
+Bulk import of Kinovea sessions from a directory.
+
+The directory holds the CSVs and videos plus a manifest CSV with the columns
+player, team, date, session_name, csv, video and notes. csv and video are
+file names relative to the directory; video may also be a YouTube link.
+Every row needs a video, the CSV is optional, matching the upload form.
+
+    python bulk_ingest.py /path/to/archive --manifest season_2025.csv
+
+CSVs are parsed and validated in parallel across a process pool, then all
+players and sessions are inserted in one transaction. The CSVs and their
+columnar copies are staged under temporary names and only moved into place
+once that transaction commits, so a failed import leaves no files behind and
+can simply be run again.
+"""
+import argparse
+import csv
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from analytics import sequence_metrics
+from db import DB_PATH, connect, get_or_create_player
+from kinovea import columnar_path_for, load_kinovea_csv, validate_kinovea_frame
+from migrate_sessions_schema import run_migrations
+from session_metrics import store_session_metrics
+from similarity import session_embedding, store_session_embeddings
+from storage import DATA_DIR, VIDEO_DIR, csv_path_for, file_sha256, store_video
+from video_index import refresh_video_metadata
+
+MANIFEST_COLUMNS = ["player", "team", "date", "session_name", "csv", "video", "notes"]
+
+
+def read_manifest(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        missing = [col for col in MANIFEST_COLUMNS if col not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"manifest is missing column(s): {', '.join(missing)}")
+        return [{col: (row[col] or "").strip() for col in MANIFEST_COLUMNS} for row in reader]
+
+
+def _stage(final_path):
+    # Temp file next to its final name so moving it into place is a rename.
+    # Its fresh mtime keeps maintenance from treating it as orphaned.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path) or ".", suffix=".part")
+    os.close(fd)
+    return tmp_path
+
+
+def _discard(staged):
+    for tmp_path, _ in staged:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def prepare_csv(src_path, dest_path, dry_run=False):
+    """
+    Parses and validates one Kinovea CSV and, unless dry_run, stages a copy
+    of it and its columnar copy under temporary names. "staged" holds the
+    (temp, final) path pairs to move into place once the sessions are
+    committed. Runs in a worker process.
+    """
+    df = load_kinovea_csv(src_path)
+    validate_kinovea_frame(df)
+    if dry_run:
+        return None
+
+    arrow_path = columnar_path_for(dest_path)
+    staged = []
+    try:
+        staged.append((_stage(dest_path), dest_path))
+        shutil.copyfile(src_path, staged[0][0])
+        staged.append((_stage(arrow_path), arrow_path))
+        df.to_feather(staged[1][0], compression="uncompressed")
+        return {
+            "csv": dest_path,
+            "arrow": arrow_path,
+            "staged": staged,
+            "checksum": file_sha256(staged[0][0]),
+            "metrics": sequence_metrics(df),
+            "embedding": session_embedding(df),
+        }
+    except Exception:
+        _discard(staged)
+        raise
+
+
+def _existing_sessions(conn):
+    # Keys (lower-cased player, date, session_name) of the stored sessions,
+    # and the CSV paths they use
+    keys = {tuple(row) for row in conn.execute(
+        '''SELECT LOWER(p.name), COALESCE(s.date, ''), s.session_name
+           FROM sessions s JOIN players p ON p.id = s.player_id''')}
+    csv_paths = {row[0] for row in conn.execute("SELECT kinovea_csv FROM sessions WHERE kinovea_csv IS NOT NULL")}
+    return keys, csv_paths
+
+
+def _check_rows(rows, directory, data_dir, existing=(frozenset(), frozenset())):
+    # Cheap per-row checks before any parsing. Returns (row number, row, CSV
+    # destination) triples worth parsing and prints why the others were
+    # skipped. existing is what _existing_sessions returned, so rows already
+    # in the database are skipped and no destination clashes with a stored
+    # session's CSV.
+    imported, used_csvs = existing
+    accepted, seen_keys, taken = [], set(), set(used_csvs)
+    for number, row in enumerate(rows, start=2):
+        problem = None
+        key = (row["player"].lower(), row["date"], row["session_name"])
+        if not row["player"] or not row["session_name"]:
+            problem = "player and session_name are required"
+        elif not row["video"]:
+            problem = "a video file or YouTube link is required"
+        elif not row["video"].startswith("http") and not os.path.exists(os.path.join(directory, row["video"])):
+            problem = f"video {row['video']} not found"
+        elif row["csv"] and not os.path.exists(os.path.join(directory, row["csv"])):
+            problem = f"CSV {row['csv']} not found"
+        elif key in imported:
+            problem = "session already imported"
+        elif key in seen_keys:
+            problem = "session listed twice in the manifest"
+
+        if problem:
+            print(f"⚠️ Row {number} skipped: {problem}.")
+            continue
+        seen_keys.add(key)
+        dest = None
+        if row["csv"]:
+            dest = csv_path_for(row["player"], row["session_name"], row["date"], data_dir, taken)
+            taken.add(dest)
+        accepted.append((number, row, dest))
+    return accepted
+
+
+def _insert_sessions(db_path, rows, prepared, videos):
+    # Every player and session of the import in one transaction
+    with connect(db_path) as conn:
+        c = conn.cursor()
+        c.execute("BEGIN")
+        try:
+            metrics_rows, embedding_rows = [], []
+            for number, row in rows:
+                player_id = get_or_create_player(c, row["player"], row["team"])
+                csv_info = prepared.get(number) or {}
+                video_source, video_sha256 = videos[number]
+                c.execute('''INSERT INTO sessions
+                             (player_id, date, session_name, video_source, video_sha256, kinovea_csv, kinovea_arrow, notes)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (player_id, row["date"], row["session_name"], video_source, video_sha256,
+                           csv_info.get("csv"), csv_info.get("arrow"), row["notes"]))
+                if csv_info:
+                    metrics_rows.append((int(c.lastrowid), csv_info["checksum"], csv_info["metrics"]))
+                    embedding_rows.append((int(c.lastrowid), csv_info["checksum"], csv_info["embedding"]))
+            store_session_metrics(c, metrics_rows)
+            store_session_embeddings(c, embedding_rows)
+            refresh_video_metadata(c, [source for source, _ in videos.values()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def ingest(directory, manifest_path, db_path=DB_PATH, data_dir=DATA_DIR, video_dir=VIDEO_DIR,
+           workers=None, dry_run=False):
+    """Imports every valid manifest row and returns the number of sessions added."""
+    with connect(db_path) as conn:
+        run_migrations(conn)
+        existing = _existing_sessions(conn)
+    rows = _check_rows(read_manifest(manifest_path), directory, data_dir, existing)
+
+    # Parse and validate all CSVs in parallel
+    prepared = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            number: pool.submit(prepare_csv, os.path.join(directory, row["csv"]), dest, dry_run)
+            for number, row, dest in rows if dest
+        }
+        for number, future in futures.items():
+            try:
+                prepared[number] = future.result()
+            except Exception as e:
+                print(f"⚠️ Row {number} skipped: invalid CSV ({e}).")
+
+    rows = [(number, row) for number, row, dest in rows if not dest or number in prepared]
+    if dry_run:
+        print(f"✅ Dry run: {len(rows)} session(s) would be imported.")
+        return 0
+
+    staged = [pair for info in prepared.values() for pair in info["staged"]]
+    try:
+        # Videos are streamed into content-addressed storage one at a time
+        videos = {}
+        for number, row in rows:
+            if row["video"].startswith("http"):
+                videos[number] = (row["video"], None)
+            else:
+                src = os.path.join(directory, row["video"])
+                with open(src, "rb") as f:
+                    videos[number] = store_video(f, src, video_dir)
+        _insert_sessions(db_path, rows, prepared, videos)
+    except Exception:
+        _discard(staged)
+        raise
+
+    for tmp_path, path in staged:
+        os.replace(tmp_path, path)
+    print(f"✅ Imported {len(rows)} session(s).")
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import Kinovea sessions from a directory and manifest.")
+    parser.add_argument("directory", help="directory holding the CSVs, videos and manifest")
+    parser.add_argument("--manifest", help="manifest CSV (default: <directory>/manifest.csv)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--db", default=DB_PATH, help=f"database path (default: {DB_PATH})")
+    parser.add_argument("--dry-run", action="store_true", help="validate everything without writing")
+    args = parser.parse_args(argv)
+
+    manifest = args.manifest or os.path.join(args.directory, "manifest.csv")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    os.makedirs(VIDEO_DIR, exist_ok=True)
+    ingest(args.directory, manifest, db_path=args.db, workers=args.workers, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
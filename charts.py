@@ -0,0 +1,180 @@
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+from analytics import mean_sd_band
+from kinovea import COLOR_MAP, TIME_COL
+from signals import FILTERED_SUFFIX, is_acceleration, source_channel
+from profiling import timed
+
+# Traces longer than this are downsampled with LTTB and drawn with WebGL
+MAX_PLOT_POINTS = 1500
+
+# Downsampled (x, y) pairs kept per (data key, metric, max points)
+DOWNSAMPLE_CACHE_SIZE = 256
+
+_downsample_cache = OrderedDict()
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: picks n_out indices that keep the visual
+    shape of the curve (peaks included). Always keeps the first and last point.
+
+    Each bucket's triangle is anchored on the averages of the buckets either
+    side instead of the point picked in the previous one, so all buckets are
+    reduced at once on a padded 2-D array.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, lengths = edges[:-1], np.diff(edges)
+
+    # Bucket averages, with the first and last point as buckets of their own.
+    # The buckets end at edges[-1] == n - 1, hence the reductions over [:-1].
+    valid = ~np.isnan(y)
+    counts = np.add.reduceat(valid[:-1].astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_x = np.concatenate(([x[0]], np.add.reduceat(x[:-1], starts) / lengths, [x[-1]]))
+        avg_y = np.concatenate(([y[0]], np.add.reduceat(np.where(valid, y, 0.0)[:-1], starts) / counts, [y[-1]]))
+    # Buckets without a single value borrow the average of their neighbours
+    known = ~np.isnan(avg_y)
+    if known.any():
+        avg_y = np.interp(np.arange(len(avg_y)), np.flatnonzero(known), avg_y[known])
+
+    # One row per bucket, padded to the longest one
+    offsets = np.arange(lengths.max())
+    candidates = np.minimum(starts[:, None] + offsets, n - 1)
+    prev_x, prev_y = avg_x[:-2, None], avg_y[:-2, None]
+    next_x, next_y = avg_x[2:, None], avg_y[2:, None]
+
+    # Twice the area of the triangle (previous average, candidate, next average)
+    cx, cy = x[candidates], y[candidates]
+    area = np.abs((prev_x - next_x) * (cy - prev_y) - (prev_x - cx) * (next_y - prev_y))
+    area = np.where(np.isnan(area) | (offsets >= lengths[:, None]), -1.0, area)
+
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    idx[1:-1] = starts + area.argmax(axis=1)
+    return idx
+
+
+def downsample(x, y, max_points=MAX_PLOT_POINTS, data_key=None, metric=None):
+    """
+    Returns (x, y) reduced to at most max_points with LTTB. When data_key is
+    given (e.g. kinovea.file_key of the session file), results are cached per
+    data key and metric.
+    """
+    if len(x) <= max_points:
+        return x, y
+
+    key = (data_key, metric, max_points) if data_key is not None else None
+    if key is not None and key in _downsample_cache:
+        _downsample_cache.move_to_end(key)
+        return _downsample_cache[key]
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    idx = lttb(x, y, max_points)
+    result = (x[idx], y[idx])
+
+    if key is not None:
+        _downsample_cache[key] = result
+        if len(_downsample_cache) > DOWNSAMPLE_CACHE_SIZE:
+            _downsample_cache.popitem(last=False)
+    return result
+
+
+def line_trace(x, y, webgl=False, **kwargs):
+    """A lines trace, drawn with WebGL for long or numerous series."""
+    trace_type = go.Scattergl if webgl else go.Scatter
+    return trace_type(x=x, y=y, mode='lines', **kwargs)
+
+
+def build_custom_lines_figure(df, x_col=TIME_COL, selected_metrics=None, max_points=MAX_PLOT_POINTS,
+                              data_key=None):
+    fig = go.Figure()
+    metrics = selected_metrics if selected_metrics else COLOR_MAP.keys()
+    webgl = len(df) > max_points
+
+    has_accel = False
+
+    for col in df.columns:
+        # Derived channels share their source's color, dashed when filtered
+        # and dotted for derivatives; accelerations get their own axis
+        source = col if col in COLOR_MAP else source_channel(col)
+        if col in metrics and source and col != x_col:
+            x, y = downsample(df[x_col].to_numpy(), df[col].to_numpy(), max_points, data_key, col)
+            dash = "solid" if col == source else "dash" if col.endswith(FILTERED_SUFFIX) else "dot"
+            accel = is_acceleration(col)
+            has_accel = has_accel or accel
+            fig.add_trace(line_trace(
+                x, y, webgl=webgl,
+                name=col,
+                line=dict(color=COLOR_MAP.get(source, "#cccccc"), dash=dash),
+                yaxis="y2" if accel else "y"
+            ))
+    if has_accel:
+        fig.update_layout(yaxis2=dict(title="Acceleration (px/s²)", overlaying="y", side="right"))
+    fig.update_layout(
+        xaxis_title=x_col,
+        yaxis_title="Speed (px/s)",
+        height=400,
+        legend_title="Metric",
+        template="simple_white"
+    )
+    return fig
+
+
+def plot_custom_lines(df, x_col=TIME_COL, chart_key="default", selected_metrics=None, data_key=None,
+                      on_select="ignore"):
+    """Draws the metric chart. With on_select="rerun", returns the clicked points as Streamlit's selection state."""
+    with timed("chart", f"build {chart_key}"):
+        fig = build_custom_lines_figure(df, x_col=x_col, selected_metrics=selected_metrics, data_key=data_key)
+    with timed("chart", f"serialize {chart_key}"):
+        return st.plotly_chart(fig, use_container_width=True, key=chart_key, on_select=on_select,
+                               selection_mode="points")
+
+
+def build_aligned_overlay_figure(grid, curves, labels, metric, event_label, max_points=MAX_PLOT_POINTS):
+    fig = go.Figure()
+    color = COLOR_MAP.get(metric, "#cccccc")
+
+    # Switch the per-session lines to WebGL once the overlay gets heavy
+    webgl = curves.size > max_points
+    for label, curve in zip(labels, curves):
+        fig.add_trace(line_trace(
+            grid, curve, webgl=webgl, name=label,
+            line=dict(color="#bbbbbb", width=1), opacity=0.6, showlegend=False,
+            hovertemplate=f"{label}<br>%{{x:.0f}} ms: %{{y:.1f}}<extra></extra>"
+        ))
+
+    mean, sd = mean_sd_band(curves)
+    fig.add_trace(go.Scatter(
+        x=list(grid) + list(grid[::-1]), y=list(mean + sd) + list((mean - sd)[::-1]),
+        fill='toself', fillcolor=color, opacity=0.2, line=dict(width=0),
+        name="Mean ± SD", hoverinfo="skip"
+    ))
+    fig.add_trace(go.Scatter(x=grid, y=mean, mode='lines', name="Mean", line=dict(color=color, width=3)))
+    fig.add_vline(x=0, line_dash="dash", line_color="#888888")
+
+    fig.update_layout(
+        xaxis_title=f"Time from {event_label} (ms)",
+        yaxis_title=metric,
+        height=450,
+        template="simple_white"
+    )
+    return fig
+
+
+def plot_aligned_overlay(grid, curves, labels, metric, event_label, chart_key="overlay"):
+    with timed("chart", f"build {chart_key}"):
+        fig = build_aligned_overlay_figure(grid, curves, labels, metric, event_label)
+    with timed("chart", f"serialize {chart_key}"):
+        st.plotly_chart(fig, use_container_width=True, key=chart_key)
@@ -0,0 +1,114 @@
+import atexit
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from profiling import timed
+
+DB_PATH = "pitcher_biomech.db"
+
+# Idle connections kept open per database file
+POOL_SIZE = 4
+
+# Prepared statements cached per connection. Queries are written as constant
+# SQL strings with ? parameters so repeated calls hit this cache.
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",      # readers no longer block the upload writer
+    "PRAGMA synchronous=NORMAL",    # safe with WAL, one fsync per checkpoint
+    "PRAGMA busy_timeout=5000",     # wait for a competing writer instead of failing
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",     # 16 MB page cache
+]
+
+# The no-op update makes RETURNING give the existing row's id on conflict. It
+# sets id rather than name so the search index's player-update trigger, which
+# watches name, team and notes, doesn't re-index the player's sessions.
+UPSERT_PLAYER_SQL = '''INSERT INTO players (name, team, notes) VALUES (?, ?, '')
+    ON CONFLICT (LOWER(name), LOWER(team)) DO UPDATE SET id = players.id
+    RETURNING id'''
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _open(db_path):
+    # Streamlit runs each session in its own thread, so pooled connections
+    # have to be usable from whichever thread checks them out.
+    conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _get_pool(db_path):
+    with _pools_lock:
+        if db_path not in _pools:
+            _pools[db_path] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return _pools[db_path]
+
+
+@contextmanager
+def connect(db_path=DB_PATH):
+    """
+    Checks a connection out of the per-process pool for the duration of the
+    block. Any transaction left open is rolled back before the connection is
+    returned, and connections beyond POOL_SIZE are closed instead of kept.
+    """
+    pool = _get_pool(db_path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _open(db_path)
+
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def query_df(conn, sql, params=(), label=None):
+    """Runs a SELECT into a DataFrame, timed under the "sql" kind."""
+    with timed("sql", label or " ".join(sql.split())):
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+def query_rows(conn, sql, params=(), label=None):
+    """Runs a SELECT and returns all its rows as tuples, timed under the "sql" kind."""
+    with timed("sql", label or " ".join(sql.split())):
+        return conn.execute(sql, params).fetchall()
+
+
+def get_or_create_player(c, name, team):
+    """
+    Returns the id of the player with this name and team, compared
+    case-insensitively, inserting a new player if there is none. A single
+    UPSERT against the unique (LOWER(name), LOWER(team)) index, so two
+    concurrent uploads can't both create the player.
+    """
+    c.execute(UPSERT_PLAYER_SQL, (name, team))
+    return int(c.fetchone()[0])
+
+
+def close_all():
+    """Closes every idle pooled connection."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+atexit.register(close_all)
@@ -0,0 +1,113 @@
+import os
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+from profiling import timed
+
+TIME_COL = "Time (ms)"
+
+COLOR_MAP = {
+    "TE": "#1f77b4",  # blue
+    "FK": "#ff7f0e",  # orange
+    "TS": "#2ca02c",  # green
+    "FH": "#d62728",  # red
+    "Angle 1 - o": "#9467bd",  # purple
+    "Angle 1 - a": "#8c564b",  # brown
+    "Angle 1 - b": "#e377c2"   # pink
+}
+
+# Every value in a Kinovea export is quoted, so give pandas the types up front
+# instead of letting it infer them from strings.
+KINOVEA_DTYPES = {col: np.float32 for col in [TIME_COL, *COLOR_MAP]}
+
+# Number of parsed frames kept in memory per process
+CACHE_SIZE = 32
+
+
+COLUMNAR_EXT = ".arrow"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _read_kinovea(path, mtime_ns, size):
+    # mtime_ns and size are only part of the cache key, so an edited or
+    # re-uploaded file gets parsed again instead of served stale.
+    if path.endswith(COLUMNAR_EXT):
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_csv(path, dtype=KINOVEA_DTYPES)
+
+
+def file_key(path):
+    """(path, mtime, size) of a file, used to key caches of data derived from it."""
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def _load_cached(path):
+    return _read_kinovea(*file_key(path))
+
+
+def load_kinovea_csv(path):
+    """
+    Loads a Kinovea CSV export as a typed DataFrame, reusing the parsed frame
+    until the file changes on disk. The returned frame is shared between
+    callers, so copy it before modifying it.
+    """
+    return _load_cached(path)
+
+
+def validate_kinovea_frame(df):
+    """Raises ValueError if a parsed frame does not look like a Kinovea export."""
+    if TIME_COL not in df.columns:
+        raise ValueError(f"missing '{TIME_COL}' column")
+    if not any(col in COLOR_MAP for col in df.columns):
+        raise ValueError(f"no metric columns, expected some of: {', '.join(COLOR_MAP)}")
+    if len(df) < 2:
+        raise ValueError("fewer than 2 samples")
+    if not df[TIME_COL].is_monotonic_increasing:
+        raise ValueError(f"'{TIME_COL}' is not increasing")
+
+
+def clear_cache():
+    """Drops every parsed frame, e.g. to time cold loads."""
+    _read_kinovea.cache_clear()
+
+
+def columnar_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + COLUMNAR_EXT
+
+
+def write_columnar_copy(csv_path):
+    """
+    Writes an uncompressed Arrow (Feather v2) copy of a Kinovea CSV next to it
+    and returns its path. Uncompressed files can be memory-mapped on read.
+    """
+    path = columnar_path_for(csv_path)
+    df = load_kinovea_csv(csv_path)
+    # Written to a temp file and renamed into place, so readers memory-mapping
+    # the copy never see half a file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            df.to_feather(out, compression="uncompressed")
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def load_session_data(csv_path, columnar_path=None):
+    """
+    Loads a session's kinematic data, preferring the columnar copy and falling
+    back to the CSV when there is no copy or the CSV was changed after it.
+    """
+    with timed("csv", os.path.basename(csv_path)):
+        if columnar_path and os.path.exists(columnar_path):
+            if os.path.getmtime(columnar_path) >= os.path.getmtime(csv_path):
+                return _load_cached(columnar_path)
+        return load_kinovea_csv(csv_path)
@@ -0,0 +1,325 @@
+"""
+Database and file maintenance shared by the Admin tab and cron.
+
+    python maintenance.py --all --dry-run
+    python maintenance.py --broken-sessions --orphan-players
+    python maintenance.py --orphan-files --dry-run
+    python maintenance.py --hash-videos
+    python maintenance.py --backfill
+
+--backfill builds what migrations leave out because it reads every file:
+columnar copies, session metrics and embeddings, and the video index. Run it
+once after upgrading; the app otherwise fills these in as sessions are viewed.
+
+--all covers the database cleanups only; deleting files always has to be
+asked for with --orphan-files.
+
+File existence checks run in a thread pool, and every cleanup deletes its
+rows with set-based statements inside a single transaction. The delete
+functions leave committing to the caller so the app can batch them on its
+writer thread.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import DB_PATH, connect, query_rows
+from kinovea import write_columnar_copy
+from migrate_sessions_schema import run_migrations
+from percentiles import remove_from_sketches
+from session_metrics import refresh_all_session_metrics
+from signals import derived_path_for
+from similarity import refresh_all_session_embeddings
+from video_index import prune_video_metadata, refresh_all_video_metadata
+from storage import DATA_DIR, VIDEO_DIR, file_sha256
+
+# Parallel os.path.exists calls, mostly waiting on the filesystem
+CHECK_WORKERS = 16
+
+# Uploads write their files before the session row is committed, so files
+# changed this recently are never treated as orphaned
+RECENT_FILE_GRACE_SECONDS = 3600
+
+
+def _normalize(path):
+    # Rows written on Windows store backslash paths
+    return os.path.normpath(path.replace("\\", "/"))
+
+
+def existing_paths(paths, workers=CHECK_WORKERS):
+    """Returns the subset of paths that exist, checking them in parallel."""
+    unique = list(set(paths))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        exists = pool.map(os.path.exists, unique)
+    return {path for path, ok in zip(unique, exists) if ok}
+
+
+def is_local_video(video_source):
+    return bool(video_source) and not video_source.startswith("http")
+
+
+def find_broken_sessions(conn, workers=CHECK_WORKERS):
+    """Ids of sessions whose CSV or local video file is missing."""
+    rows = query_rows(conn, "SELECT id, kinovea_csv, video_source FROM sessions", label="broken session check")
+    paths = [_normalize(p) for _, csv_path, video in rows for p in (csv_path, video) if p and not p.startswith("http")]
+    found = existing_paths(paths, workers)
+
+    broken = []
+    for session_id, csv_path, video_source in rows:
+        missing_csv = bool(csv_path) and _normalize(csv_path) not in found
+        missing_video = is_local_video(video_source) and _normalize(video_source) not in found
+        if missing_csv or missing_video:
+            broken.append(session_id)
+    return broken
+
+
+def delete_sessions(conn, session_ids):
+    """
+    Deletes sessions and their derived rows with set-based statements. Files
+    are left in place, find_orphan_files picks them up. Returns the number
+    deleted. The caller commits, the app runs it on the writer thread.
+    """
+    if not session_ids:
+        return 0
+    ids = json.dumps([int(i) for i in session_ids])
+    videos = [row[0] for row in conn.execute(
+        "SELECT video_source FROM sessions WHERE id IN (SELECT value FROM json_each(?))", (ids,))]
+    remove_from_sketches(conn, session_ids)
+    conn.execute("DELETE FROM session_metrics WHERE session_id IN (SELECT value FROM json_each(?))", (ids,))
+    conn.execute("DELETE FROM session_embeddings WHERE session_id IN (SELECT value FROM json_each(?))", (ids,))
+    cur = conn.execute("DELETE FROM sessions WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+    prune_video_metadata(conn, videos)
+    return cur.rowcount
+
+
+def delete_player(conn, player_id):
+    """
+    Deletes one player if they still have no sessions, checked in the same
+    statement. Returns the number deleted (0 or 1). The caller commits.
+    """
+    cur = conn.execute(
+        "DELETE FROM players WHERE id = ? AND NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.player_id = players.id)",
+        (int(player_id),),
+    )
+    return cur.rowcount
+
+
+def delete_orphan_players(conn):
+    """Deletes every player without sessions. Returns the number deleted. The caller commits."""
+    cur = conn.execute(
+        "DELETE FROM players WHERE NOT EXISTS (SELECT 1 FROM sessions WHERE sessions.player_id = players.id)"
+    )
+    return cur.rowcount
+
+
+def referenced_files(conn, exclude_session_ids=()):
+    """
+    Normalized paths of every file some session row points to, plus the
+    derived channels of its CSV. Sessions in exclude_session_ids are left
+    out, so a dry run can see the files their deletion would orphan.
+    """
+    referenced = set()
+    excluded = {int(i) for i in exclude_session_ids}
+    rows = query_rows(conn, "SELECT id, kinovea_csv, kinovea_arrow, video_source FROM sessions",
+                      label="referenced files")
+    for session_id, *row in rows:
+        if session_id in excluded:
+            continue
+        for path in row:
+            if path and not path.startswith("http"):
+                referenced.add(_normalize(path))
+        if row[0]:
+            referenced.add(_normalize(derived_path_for(row[0])))
+    return referenced
+
+
+def _recently_changed(path, now):
+    try:
+        return now - os.stat(path).st_mtime < RECENT_FILE_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def find_orphan_files(conn, data_dir=DATA_DIR, video_dir=VIDEO_DIR, exclude_session_ids=()):
+    """
+    Files in data_dir and video_dir that no session references, ignoring
+    exclude_session_ids. Files changed within RECENT_FILE_GRACE_SECONDS are
+    skipped, as they may belong to an upload not yet committed.
+    """
+    referenced = referenced_files(conn, exclude_session_ids)
+    now = time.time()
+
+    orphans = []
+    for directory in (data_dir, video_dir):
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if now - entry.stat().st_mtime < RECENT_FILE_GRACE_SECONDS:
+                    continue
+                path = _normalize(entry.path)
+                if path not in referenced:
+                    orphans.append(path)
+    return sorted(orphans)
+
+
+def unhashed_videos(conn):
+    """(session id, path) of local videos uploaded before content addressing, so without a video_sha256."""
+    rows = conn.execute(
+        "SELECT id, video_source FROM sessions WHERE video_sha256 IS NULL AND video_source NOT LIKE 'http%'"
+    ).fetchall()
+    return [(session_id, path) for session_id, path in rows if path]
+
+
+def hash_videos(conn, workers=CHECK_WORKERS):
+    """
+    Records the SHA-256 of local videos stored before uploads were content
+    addressed. Their files keep their names, only the hash is written. The
+    files are read in parallel before anything is written. Returns the
+    number of sessions updated. The caller commits.
+    """
+    rows = [(session_id, _normalize(path)) for session_id, path in unhashed_videos(conn)]
+    found = existing_paths([path for _, path in rows], workers)
+    paths = sorted({path for _, path in rows if path in found})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = dict(zip(paths, pool.map(file_sha256, paths)))
+    updates = [(hashes[path], session_id) for session_id, path in rows if path in hashes]
+    conn.executemany("UPDATE sessions SET video_sha256 = ? WHERE id = ?", updates)
+    return len(updates)
+
+
+def backfill_columnar_copies(conn):
+    """
+    Writes the columnar copy of every session CSV that has none yet, skipping
+    missing or unreadable CSVs. Returns the number written. The caller commits.
+    """
+    rows = conn.execute(
+        "SELECT id, kinovea_csv FROM sessions WHERE kinovea_csv IS NOT NULL AND kinovea_arrow IS NULL"
+    ).fetchall()
+    written = 0
+    for session_id, csv_path in rows:
+        if not os.path.exists(csv_path):
+            print(f"⚠️ Skipping session {session_id}: {csv_path} not found.")
+            continue
+        try:
+            arrow_path = write_columnar_copy(csv_path)
+        except Exception as e:
+            print(f"⚠️ Skipping session {session_id}: could not convert {csv_path} ({e}).")
+            continue
+        conn.execute("UPDATE sessions SET kinovea_arrow = ? WHERE id = ?", (arrow_path, session_id))
+        written += 1
+    return written
+
+
+def backfill(conn):
+    """Runs every file backfill, committing after each. Returns {step: count}."""
+    counts = {}
+    for step, fn in (("columnar copies", backfill_columnar_copies), ("session metrics", refresh_all_session_metrics),
+                     ("session embeddings", refresh_all_session_embeddings),
+                     ("video index", refresh_all_video_metadata)):
+        counts[step] = fn(conn)
+        conn.commit()
+    return counts
+
+
+def delete_files(paths):
+    """Removes files, ignoring ones that are already gone. Returns the number removed."""
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def delete_orphan_files(conn, paths):
+    """
+    Removes those of paths that are still orphaned: the references and the
+    grace period are checked again right before deleting, since sessions may
+    have been added after the list was made. Returns the number removed.
+    """
+    referenced = referenced_files(conn)
+    now = time.time()
+    return delete_files([path for path in paths
+                         if _normalize(path) not in referenced and not _recently_changed(path, now)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean up broken sessions, orphaned players and orphaned files.")
+    parser.add_argument("--broken-sessions", action="store_true", help="remove sessions with a missing CSV or local video")
+    parser.add_argument("--orphan-players", action="store_true", help="remove players with no sessions")
+    parser.add_argument("--orphan-files", action="store_true", help="remove files in data/ and videos/ no session uses")
+    parser.add_argument("--hash-videos", action="store_true", help="record the hash of videos stored before hashing")
+    parser.add_argument("--backfill", action="store_true",
+                        help="build missing columnar copies, metrics, embeddings and video index rows")
+    parser.add_argument("--all", action="store_true", help="remove broken sessions and orphaned players (not files)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be removed without removing it")
+    parser.add_argument("--db", default=DB_PATH, help=f"database path (default: {DB_PATH})")
+    args = parser.parse_args(argv)
+
+    if not (args.broken_sessions or args.orphan_players or args.orphan_files or args.hash_videos or args.backfill
+            or args.all):
+        parser.error("choose at least one cleanup, or --all")
+
+    with connect(args.db) as conn:
+        run_migrations(conn)
+
+        if args.backfill:
+            if args.dry_run:
+                print("Backfill skipped in a dry run.")
+            else:
+                for step, count in backfill(conn).items():
+                    print(f"✅ Backfilled {count} {step} row(s).")
+
+        if args.hash_videos:
+            if args.dry_run:
+                print(f"Would hash {len(unhashed_videos(conn))} video(s).")
+            else:
+                hashed = hash_videos(conn)
+                conn.commit()
+                print(f"✅ Hashed {hashed} video(s).")
+
+        # A dry run deletes nothing, so the later steps are told which
+        # sessions the real run would have removed by then
+        broken = []
+        if args.broken_sessions or args.all:
+            broken = find_broken_sessions(conn)
+            if args.dry_run:
+                print(f"Would remove {len(broken)} broken session(s): {broken}")
+            else:
+                removed = delete_sessions(conn, broken)
+                conn.commit()
+                print(f"✅ Removed {removed} broken session(s).")
+
+        if args.orphan_players or args.all:
+            if args.dry_run:
+                count = conn.execute(
+                    "SELECT COUNT(*) FROM players WHERE NOT EXISTS "
+                    "(SELECT 1 FROM sessions WHERE sessions.player_id = players.id "
+                    "AND sessions.id NOT IN (SELECT value FROM json_each(?)))",
+                    (json.dumps(broken),),
+                ).fetchone()[0]
+                print(f"Would remove {count} player(s) with no sessions.")
+            else:
+                removed = delete_orphan_players(conn)
+                conn.commit()
+                print(f"✅ Removed {removed} player(s) with no sessions.")
+
+        if args.orphan_files:
+            orphans = find_orphan_files(conn, exclude_session_ids=broken if args.dry_run else ())
+            if args.dry_run:
+                print(f"Would remove {len(orphans)} orphaned file(s):")
+                for path in orphans:
+                    print(f"  {path}")
+            else:
+                print(f"✅ Removed {delete_orphan_files(conn, orphans)} orphaned file(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,47 @@
-import sqlite3
+import threading
 
-DB_PATH = "pitcher_biomech.db"
+from db import DB_PATH, connect
+from percentiles import rebuild_sketches
 
-def migrate_schema():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+# Migrations run in list order. PRAGMA user_version stores how many of them
+# have been applied, so append new steps to the end and never reorder.
+# They only change the schema and rows already in the database: anything that
+# reads every CSV or video (columnar copies, metrics, embeddings, the video
+# index, video hashes) is filled by "python maintenance.py --backfill" or
+# lazily by the app, so startup never holds the write lock for long.
 
+# Databases this process has brought up to date, and the lock that keeps two
+# Streamlit sessions from migrating the same one at once
+_current = set()
+_migrate_lock = threading.Lock()
+
+
+def create_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS players (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        team TEXT,
+        notes TEXT
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        player_id INTEGER,
+        date TEXT,
+        session_name TEXT,
+        video_source TEXT,
+        kinovea_csv TEXT,
+        notes TEXT,
+        FOREIGN KEY(player_id) REFERENCES players(id)
+    )''')
+
+
+def rename_youtube_link(c):
     # Step 1: Check if old schema exists and already has video_source
     c.execute("PRAGMA table_info(sessions)")
     columns = [row[1] for row in c.fetchall()]
     if "video_source" in columns:
-        print("✅ Migration not needed — 'video_source' already exists.")
         return
 
-    print("🚧 Starting migration...")
-
     # Step 2: Rename old table
     c.execute("ALTER TABLE sessions RENAME TO sessions_old")
 
@@ -41,9 +68,262 @@ def migrate_schema():
     # Step 5: Drop the old table
     c.execute("DROP TABLE sessions_old")
 
-    conn.commit()
-    conn.close()
-    print("✅ Migration complete. 'youtube_link' replaced with 'video_source'.")
+
+def add_columnar_copies(c):
+    # Step 1: Add the kinovea_arrow column if it is missing
+    c.execute("PRAGMA table_info(sessions)")
+    columns = [row[1] for row in c.fetchall()]
+    if "kinovea_arrow" not in columns:
+        c.execute("ALTER TABLE sessions ADD COLUMN kinovea_arrow TEXT")
+
+    # Copies of existing CSVs are written by maintenance.backfill_columnar_copies
+
+
+def add_query_indexes(c):
+    # Sessions are always looked up by player, and the expression index
+    # matches the case-insensitive player dedup lookup used on upload.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_player_date ON sessions(player_id, date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_players_name_team ON players(LOWER(name), LOWER(team))")
+    c.execute("ANALYZE")
+
+
+def add_video_hashes(c):
+    # Step 1: Add the video_sha256 column used for content-addressed videos
+    c.execute("PRAGMA table_info(sessions)")
+    columns = [row[1] for row in c.fetchall()]
+    if "video_sha256" not in columns:
+        c.execute("ALTER TABLE sessions ADD COLUMN video_sha256 TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_video_sha256 ON sessions(video_sha256)")
+    # Videos uploaded before content addressing are hashed by
+    # "python maintenance.py --hash-videos", not here: hashing every file
+    # would hold the startup transaction for minutes.
+
+
+def add_session_metrics(c):
+    # One row of derived kinematic summaries per session, keyed to the CSV
+    # checksum it was computed from so unchanged sessions are never re-read.
+    c.execute('''CREATE TABLE IF NOT EXISTS session_metrics (
+        session_id INTEGER PRIMARY KEY,
+        csv_sha256 TEXT NOT NULL,
+        fk_peak_speed REAL,
+        fk_peak_time REAL,
+        fh_peak_speed REAL,
+        fh_peak_time REAL,
+        ts_peak_speed REAL,
+        ts_peak_time REAL,
+        te_peak_speed REAL,
+        te_peak_time REAL,
+        fk_fh_gap_ms REAL,
+        fk_fh_speed_gain REAL,
+        fh_ts_gap_ms REAL,
+        fh_ts_speed_gain REAL,
+        ts_te_gap_ms REAL,
+        ts_te_speed_gain REAL,
+        peak_order TEXT,
+        proper_sequence INTEGER,
+        updated_at TEXT,
+        FOREIGN KEY(session_id) REFERENCES sessions(id) ON DELETE CASCADE
+    )''')
+    # Rows are filled lazily by the View tab or maintenance.py --backfill
+
+
+def add_browser_indexes(c):
+    # Matches the date sort of the paginated sessions browser so each page is
+    # an index range scan instead of a full sort.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_date_id ON sessions(COALESCE(date, ''), id)")
+
+
+# Row of the search index for the sessions matched by the WHERE clause
+_SEARCH_ROWS = '''SELECT s.id, s.session_name, s.notes, p.name, p.team, p.notes
+    FROM sessions s LEFT JOIN players p ON p.id = s.player_id'''
+
+
+def add_session_search(c):
+    # Step 1: FTS5 index with one row per session (rowid = sessions.id) that
+    # also carries its player's name, team and notes.
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS session_search USING fts5(
+        session_name, session_notes, player_name, team, player_notes,
+        tokenize = 'porter unicode61'
+    )''')
+
+    # Step 2: Triggers keep it in sync with every write to either table
+    insert = "INSERT INTO session_search (rowid, session_name, session_notes, player_name, team, player_notes)"
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS session_search_insert AFTER INSERT ON sessions BEGIN
+        {insert} {_SEARCH_ROWS} WHERE s.id = new.id;
+    END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS session_search_update
+    AFTER UPDATE OF player_id, session_name, notes ON sessions BEGIN
+        DELETE FROM session_search WHERE rowid = old.id;
+        {insert} {_SEARCH_ROWS} WHERE s.id = new.id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS session_search_delete AFTER DELETE ON sessions BEGIN
+        DELETE FROM session_search WHERE rowid = old.id;
+    END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS session_search_player_update
+    AFTER UPDATE OF name, team, notes ON players BEGIN
+        DELETE FROM session_search WHERE rowid IN (SELECT id FROM sessions WHERE player_id = new.id);
+        {insert} {_SEARCH_ROWS} WHERE s.player_id = new.id;
+    END''')
+
+    # Step 3: Index the sessions that already exist
+    c.execute("DELETE FROM session_search")
+    c.execute(f"{insert} {_SEARCH_ROWS}")
+
+
+def add_metric_sketches(c):
+    # Cohort percentiles merge these log-bucket counts instead of re-reading
+    # CSVs; uploads add a session's counts and deletes take them back out.
+    # Per team, month and metric, the number of sessions in each value bucket.
+    c.execute('''CREATE TABLE IF NOT EXISTS metric_sketches (
+        team TEXT NOT NULL,
+        month TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (team, month, metric, bucket)
+    )''')
+    rebuild_sketches(c)
+
+
+def add_session_embeddings(c):
+    # Fixed-length resampled curves of each session for similarity search,
+    # keyed to the CSV checksum like session_metrics.
+    c.execute('''CREATE TABLE IF NOT EXISTS session_embeddings (
+        session_id INTEGER PRIMARY KEY,
+        csv_sha256 TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        updated_at TEXT,
+        FOREIGN KEY(session_id) REFERENCES sessions(id) ON DELETE CASCADE
+    )''')
+    # Rows are filled lazily by the View tab or maintenance.py --backfill
+
+
+def add_unique_player_index(c):
+    # Step 1: Fold case-insensitive duplicate players into the oldest one
+    c.execute('''SELECT MIN(id), GROUP_CONCAT(id) FROM players
+                 GROUP BY LOWER(name), LOWER(team) HAVING COUNT(*) > 1''')
+    merges = c.fetchall()
+    for keep_id, ids in merges:
+        duplicates = [int(i) for i in ids.split(",") if int(i) != keep_id]
+        placeholders = ", ".join("?" * len(duplicates))
+        c.execute(f"UPDATE sessions SET player_id = ? WHERE player_id IN ({placeholders})", [keep_id, *duplicates])
+        c.execute(f"DELETE FROM players WHERE id IN ({placeholders})", duplicates)
+        print(f"Merged duplicate player ids {duplicates} into {keep_id}.")
+    # Merged sessions may now count under their kept player's spelling of the team
+    if merges:
+        rebuild_sketches(c)
+
+    # Step 2: Make the dedup lookup index unique so player resolution can be
+    # a single UPSERT
+    c.execute("DROP INDEX IF EXISTS idx_players_name_team")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_players_name_team ON players(LOWER(name), LOWER(team))")
+
+
+def add_video_metadata(c):
+    # Container-level facts about each local video, read from its mp4/mov
+    # header, so charts can be mapped onto video time without opening it.
+    c.execute('''CREATE TABLE IF NOT EXISTS video_metadata (
+        path TEXT PRIMARY KEY,
+        size INTEGER,
+        mtime_ns INTEGER,
+        duration_s REAL,
+        fps REAL,
+        width INTEGER,
+        height INTEGER,
+        frame_count INTEGER,
+        codec TEXT,
+        keyframes TEXT,
+        error TEXT,
+        indexed_at TEXT
+    )''')
+    # Videos are indexed on upload, from the Admin tab or by maintenance.py --backfill
+
+
+def add_embedding_version(c):
+    # Step 1: Counter bumped by every write to session_embeddings, so the
+    # similarity search can tell its cached matrix is stale with one lookup
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )''')
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('session_embeddings', 0)")
+
+    # Step 2: Triggers so no writer can forget to bump it
+    bump = "UPDATE table_versions SET version = version + 1 WHERE name = 'session_embeddings'"
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS session_embeddings_version_{event.lower()}
+        AFTER {event} ON session_embeddings BEGIN
+            {bump};
+        END''')
+
+
+def add_video_source_index(c):
+    # Deletes check whether another session still uses a video, and the
+    # Admin tab whether a video file is shared
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_video_source ON sessions(video_source)")
+
+
+MIGRATIONS = [
+    create_base_tables,
+    rename_youtube_link,
+    add_columnar_copies,
+    add_query_indexes,
+    add_video_hashes,
+    add_session_metrics,
+    add_browser_indexes,
+    add_session_search,
+    add_metric_sketches,
+    add_session_embeddings,
+    add_unique_player_index,
+    add_video_metadata,
+    add_embedding_version,
+    add_video_source_index,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """
+    Applies every migration newer than the database's user_version, each in
+    its own transaction, and returns the list of migrations that ran. Once a
+    database is current this process never checks it again. Threads wait on
+    a lock, and each transaction takes the write lock up front and re-reads
+    the version, so another process migrating at the same time is not
+    repeated.
+    """
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    if db_file in _current:
+        return []
+
+    applied = []
+    with _migrate_lock:
+        while db_file not in _current:
+            c = conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                number = schema_version(conn)
+                if number >= len(MIGRATIONS):
+                    conn.rollback()
+                    _current.add(db_file)
+                    break
+                MIGRATIONS[number](c)
+                c.execute(f"PRAGMA user_version = {number + 1}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(MIGRATIONS[number].__name__)
+    return applied
+
 
 if __name__ == "__main__":
-    migrate_schema()
+    with connect(DB_PATH) as conn:
+        applied = run_migrations(conn)
+        if applied:
+            print(f"✅ Applied {len(applied)} migration(s): {', '.join(applied)}.")
+        else:
+            print("✅ Migration not needed — schema is already up to date.")
+        print(f"Schema version: {schema_version(conn)}")
@@ -0,0 +1,162 @@
+import json
+import math
+
+import pandas as pd
+
+from analytics import SEGMENT_PAIRS, SEGMENTS
+from db import query_rows
+
+# Metrics that are comparable across pitchers. Peak times are left out, they
+# are positions within a capture rather than properties of the delivery.
+SKETCH_METRICS = [f"{seg.lower()}_peak_speed" for seg in SEGMENTS]
+for _a, _b in SEGMENT_PAIRS:
+    SKETCH_METRICS += [f"{_a.lower()}_{_b.lower()}_gap_ms", f"{_a.lower()}_{_b.lower()}_speed_gain"]
+
+# Log-spaced buckets (as in DDSketch): any quantile read from a sketch is
+# within RELATIVE_ACCURACY of the true value. Bucket 0 holds values too close
+# to zero to tell apart, negative values get negative bucket keys, so sorting
+# by key sorts by value and a cohort sketch is just the sum of its cells.
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-3
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+_OFFSET = 1 - math.ceil(math.log(MIN_VALUE) / _LOG_GAMMA)
+
+# Sketch rows of the given sessions, one per metric with a value
+_SESSION_METRICS_SQL = f'''SELECT COALESCE(p.team, ''), SUBSTR(COALESCE(s.date, ''), 1, 7),
+        {", ".join(f"m.{metric}" for metric in SKETCH_METRICS)}
+    FROM session_metrics m
+    JOIN sessions s ON s.id = m.session_id
+    LEFT JOIN players p ON p.id = s.player_id
+    WHERE m.session_id IN (SELECT value FROM json_each(?))'''
+
+
+def bucket_key(value):
+    if abs(value) < MIN_VALUE:
+        return 0
+    key = math.ceil(math.log(abs(value)) / _LOG_GAMMA) + _OFFSET
+    return key if value > 0 else -key
+
+
+def bucket_value(key):
+    """Representative value of a bucket, within RELATIVE_ACCURACY of everything in it."""
+    if key == 0:
+        return 0.0
+    value = 2 * _GAMMA ** (abs(key) - _OFFSET) / (_GAMMA + 1)
+    return value if key > 0 else -value
+
+
+def _update_sketches(conn, session_ids, sign):
+    ids = json.dumps([int(i) for i in session_ids])
+    cells = {}
+    for team, month, *values in conn.execute(_SESSION_METRICS_SQL, (ids,)).fetchall():
+        for metric, value in zip(SKETCH_METRICS, values):
+            if value is None or math.isnan(value):
+                continue
+            cell = (team, month, metric, bucket_key(value))
+            cells[cell] = cells.get(cell, 0) + sign
+    if not cells:
+        return
+    conn.executemany(
+        '''INSERT INTO metric_sketches (team, month, metric, bucket, count) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(team, month, metric, bucket) DO UPDATE SET count = count + excluded.count''',
+        [(*cell, count) for cell, count in cells.items()],
+    )
+    conn.execute("DELETE FROM metric_sketches WHERE count <= 0")
+
+
+def add_to_sketches(conn, session_ids):
+    """Counts the stored session_metrics of these sessions into the sketches. The caller commits."""
+    _update_sketches(conn, session_ids, 1)
+
+
+def remove_from_sketches(conn, session_ids):
+    """
+    Takes the stored session_metrics of these sessions back out of the
+    sketches. Call before the rows are deleted or overwritten. The caller commits.
+    """
+    _update_sketches(conn, session_ids, -1)
+
+
+def rebuild_sketches(conn):
+    """Recounts every sketch from session_metrics, e.g. after players changed team. The caller commits."""
+    conn.execute("DELETE FROM metric_sketches")
+    ids = [row[0] for row in conn.execute("SELECT session_id FROM session_metrics").fetchall()]
+    add_to_sketches(conn, ids)
+
+
+def cohort_sketches(conn, team=None, month_from=None, month_to=None):
+    """
+    Merges the sketches of a cohort: every session, or those of one team
+    and/or between two "YYYY-MM" months (inclusive). Returns {metric: [(bucket,
+    count), ...]} sorted by bucket. The work depends on the number of buckets,
+    not on the number of sessions.
+    """
+    clauses, params = [], []
+    if team is not None:
+        clauses.append("team = ?")
+        params.append(team)
+    if month_from:
+        clauses.append("month >= ?")
+        params.append(month_from)
+    if month_to:
+        clauses.append("month <= ?")
+        params.append(month_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = query_rows(
+        conn,
+        f'''SELECT metric, bucket, SUM(count) FROM metric_sketches {where}
+            GROUP BY metric, bucket ORDER BY metric, bucket''',
+        params, label="cohort sketches")
+
+    sketches = {}
+    for metric, bucket, count in rows:
+        sketches.setdefault(metric, []).append((bucket, count))
+    return sketches
+
+
+def percentile_rank(sketch, value):
+    """Percentage of the cohort below value, counting ties as half."""
+    total = sum(count for _, count in sketch)
+    if not total:
+        return float("nan")
+    key = bucket_key(value)
+    below = sum(count for bucket, count in sketch if bucket < key)
+    equal = sum(count for bucket, count in sketch if bucket == key)
+    return 100 * (below + equal / 2) / total
+
+
+def quantile(sketch, q):
+    """Approximate q-quantile (0-1) of the cohort."""
+    total = sum(count for _, count in sketch)
+    if not total:
+        return float("nan")
+    rank = q * (total - 1)
+    seen = 0
+    for bucket, count in sketch:
+        seen += count
+        if seen > rank:
+            return bucket_value(bucket)
+    return bucket_value(sketch[-1][0])
+
+
+def cohort_percentiles(conn, metrics, team=None, month_from=None, month_to=None):
+    """
+    Table of each sketched metric of one session (a sequence_metrics dict)
+    with its percentile in the cohort, the cohort median and cohort size.
+    """
+    sketches = cohort_sketches(conn, team, month_from, month_to)
+    rows = []
+    for metric in SKETCH_METRICS:
+        value = metrics.get(metric)
+        if value is None or pd.isna(value):
+            continue
+        sketch = sketches.get(metric, [])
+        rows.append({
+            "Metric": metric,
+            "Value": round(float(value), 2),
+            "Percentile": round(percentile_rank(sketch, value), 1),
+            "Cohort median": round(quantile(sketch, 0.5), 2),
+            "Cohort sessions": sum(count for _, count in sketch),
+        })
+    return pd.DataFrame(rows, columns=["Metric", "Value", "Percentile", "Cohort median", "Cohort sessions"])
@@ -0,0 +1,59 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Timings are collected per script thread; Streamlit runs each rerun of a
+# session in its own thread, so concurrent sessions don't mix.
+_state = threading.local()
+
+_DISABLED = nullcontext()
+
+logger = logging.getLogger("biomech.timing")
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+
+def start_run(enabled, log=False):
+    """Starts collecting timings for this rerun, or turns collection off."""
+    _state.timings = [] if enabled else None
+    _state.log = log
+    _state.started = time.perf_counter()
+
+
+def run_timings():
+    """Timings recorded so far in this rerun, as dicts with kind, label and ms."""
+    return list(getattr(_state, "timings", None) or [])
+
+
+def run_elapsed_ms():
+    started = getattr(_state, "started", None)
+    return (time.perf_counter() - started) * 1000 if started else 0.0
+
+
+@contextmanager
+def _timer(kind, label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        record = {"kind": kind, "label": label, "ms": round(ms, 3)}
+        _state.timings.append(record)
+        if _state.log:
+            logger.info(json.dumps(record))
+
+
+def timed(kind, label):
+    """
+    Context manager that records how long its block took under kind (sql, csv,
+    chart, ...) and label. When collection is off it is a shared no-op.
+    """
+    if getattr(_state, "timings", None) is None:
+        return _DISABLED
+    return _timer(kind, label)
@@ -0,0 +1,44 @@
+import re
+
+from db import query_df
+
+SEARCH_LIMIT = 50
+
+# bm25 column weights, in session_search column order: a hit in a session or
+# player name ranks above the same words buried in notes.
+BM25_WEIGHTS = (5.0, 1.0, 3.0, 2.0, 1.0)
+
+
+def fts_query(text):
+    """
+    Turns free text from the search box into an FTS5 query. Each word is
+    quoted so punctuation like "post-injury" searches as a phrase instead of
+    being read as query syntax, and prefix-matched so partial words hit.
+    Returns None when there is nothing to search for.
+    """
+    terms = [term.replace('"', '""') for term in text.split() if re.search(r"\w", term)]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_sessions(conn, text, limit=SEARCH_LIMIT):
+    """Sessions across every player matching text, best bm25 match first."""
+    query = fts_query(text)
+    if query is None:
+        return None
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    return query_df(
+        conn,
+        f'''SELECT s.id, p.name AS player, p.team, s.date, s.session_name,
+                   snippet(session_search, -1, '[', ']', '…', 10) AS match,
+                   bm25(session_search, {weights}) AS rank
+            FROM session_search
+            JOIN sessions s ON s.id = session_search.rowid
+            LEFT JOIN players p ON p.id = s.player_id
+            WHERE session_search MATCH ?
+            ORDER BY rank
+            LIMIT ?''',
+        (query, limit),
+        label="session search",
+    )
@@ -0,0 +1,117 @@
+import json
+import math
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from analytics import batch_sequence_metrics, metric_columns
+from db import query_rows
+from kinovea import load_session_data
+from percentiles import add_to_sketches, remove_from_sketches
+from storage import file_sha256
+
+METRIC_COLUMNS = metric_columns()
+
+UPSERT_SQL = f'''INSERT INTO session_metrics (session_id, csv_sha256, {", ".join(METRIC_COLUMNS)}, updated_at)
+    VALUES ({", ".join("?" * (len(METRIC_COLUMNS) + 3))})
+    ON CONFLICT(session_id) DO UPDATE SET
+    csv_sha256 = excluded.csv_sha256, {", ".join(f"{col} = excluded.{col}" for col in METRIC_COLUMNS)},
+    updated_at = excluded.updated_at'''
+
+
+@lru_cache(maxsize=1024)
+def _checksum(path, mtime_ns, size):
+    return file_sha256(path)
+
+
+def csv_checksum(path):
+    """SHA-256 of a CSV, only re-hashed when its mtime or size changes."""
+    stat = os.stat(path)
+    return _checksum(path, stat.st_mtime_ns, stat.st_size)
+
+
+def _row_values(session_id, checksum, metrics):
+    values = [session_id, checksum]
+    for col in METRIC_COLUMNS:
+        value = metrics[col]
+        if col == "proper_sequence":
+            value = int(bool(value))
+        elif isinstance(value, float) and math.isnan(value):
+            value = None
+        elif hasattr(value, "item"):
+            value = value.item()
+        values.append(value)
+    values.append(datetime.now().isoformat(timespec="seconds"))
+    return values
+
+
+def _stored_checksums(conn, session_ids):
+    if not session_ids:
+        return {}
+    rows = query_rows(
+        conn, "SELECT session_id, csv_sha256 FROM session_metrics WHERE session_id IN (SELECT value FROM json_each(?))",
+        (json.dumps([int(i) for i in session_ids]),), label="stored metric checksums")
+    return dict(rows)
+
+
+def stale_sessions(conn, sessions):
+    """
+    The (session_id, csv_path, arrow_path) tuples whose CSV checksum differs
+    from their stored session_metrics row. Only reads, so the UI can check
+    on any connection and hand just these to the writer.
+    """
+    sessions = [s for s in sessions if s[1] and os.path.exists(s[1])]
+    stored = _stored_checksums(conn, [s[0] for s in sessions])
+    return [s for s in sessions if stored.get(s[0]) != csv_checksum(s[1])]
+
+
+def refresh_session_metrics(conn, sessions):
+    """
+    Brings session_metrics up to date for the given (session_id, csv_path,
+    arrow_path) tuples. Sessions whose CSV checksum matches the stored row are
+    skipped; the rest are computed in one batch. Sessions whose CSV is missing
+    or unreadable are left alone. Returns the number of rows written. The
+    caller commits.
+    """
+    sessions = [s for s in sessions if s[1] and os.path.exists(s[1])]
+    stored = _stored_checksums(conn, [s[0] for s in sessions])
+
+    stale, checksums, frames = [], [], []
+    for session_id, csv_path, arrow_path in sessions:
+        checksum = csv_checksum(csv_path)
+        if stored.get(session_id) == checksum:
+            continue
+        try:
+            frames.append(load_session_data(csv_path, arrow_path))
+        except Exception:
+            continue
+        stale.append(session_id)
+        checksums.append(checksum)
+
+    if not stale:
+        return 0
+
+    metrics = batch_sequence_metrics(frames).to_dict("records")
+    store_session_metrics(conn, zip(stale, checksums, metrics))
+    return len(stale)
+
+
+def store_session_metrics(conn, rows):
+    """
+    Writes already computed (session_id, csv_sha256, metrics) rows, where
+    metrics is a sequence_metrics dict, and moves the cohort sketches from
+    the old values to the new ones. The caller commits.
+    """
+    values = [_row_values(*row) for row in rows]
+    session_ids = [row[0] for row in values]
+    remove_from_sketches(conn, session_ids)
+    conn.executemany(UPSERT_SQL, values)
+    add_to_sketches(conn, session_ids)
+
+
+def refresh_all_session_metrics(conn):
+    """Refreshes session_metrics for every session that has a CSV."""
+    rows = conn.execute(
+        "SELECT id, kinovea_csv, kinovea_arrow FROM sessions WHERE kinovea_csv IS NOT NULL"
+    ).fetchall()
+    return refresh_session_metrics(conn, rows)
@@ -0,0 +1,134 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+
+from analytics import SEGMENTS
+from kinovea import COLOR_MAP, TIME_COL, load_kinovea_csv, load_session_data
+from profiling import timed
+
+ANGLE_CHANNELS = [col for col in COLOR_MAP if col.startswith("Angle")]
+
+# Cutoff of the zero-phase low-pass filter. The filter is a 2nd-order
+# Butterworth run forward and backward; the cutoff of each pass is raised so
+# the combined response is still -3 dB at FILTER_CUTOFF_HZ (Winter, 2009).
+FILTER_CUTOFF_HZ = 6.0
+_PASSES_CORRECTION = (2 ** 0.5 - 1) ** 0.25
+
+# Samples mirrored onto each end before filtering so the filter settles
+# before it reaches the data
+PAD_SAMPLES = 12
+
+FILTERED_SUFFIX = " (filtered)"
+ACCEL_SUFFIX = " accel"
+VELOCITY_SUFFIX = " velocity"
+
+DERIVED_EXT = ".derived.arrow"
+
+
+def derived_columns():
+    """Every derived channel name, in display order."""
+    columns = [f"{col}{FILTERED_SUFFIX}" for col in COLOR_MAP]
+    columns += [f"{seg}{ACCEL_SUFFIX}" for seg in SEGMENTS]
+    columns += [f"{col}{VELOCITY_SUFFIX}" for col in ANGLE_CHANNELS]
+    return columns
+
+
+def source_channel(col):
+    """The raw Kinovea column a derived channel is computed from, or None."""
+    for suffix in (FILTERED_SUFFIX, ACCEL_SUFFIX, VELOCITY_SUFFIX):
+        if col.endswith(suffix) and col[:-len(suffix)] in COLOR_MAP:
+            return col[:-len(suffix)]
+    return None
+
+
+def is_acceleration(col):
+    return col.endswith(ACCEL_SUFFIX) and source_channel(col) is not None
+
+
+def butterworth_sos(cutoff_hz, sample_rate_hz):
+    """Second-order sections of a 2nd-order low-pass Butterworth filter."""
+    # Keep the cutoff below Nyquist for slow captures
+    cutoff_hz = min(cutoff_hz, 0.45 * sample_rate_hz)
+    return signal.butter(2, cutoff_hz, btype="low", output="sos", fs=sample_rate_hz)
+
+
+def filtfilt(x, sample_rate_hz, cutoff_hz=FILTER_CUTOFF_HZ):
+    """
+    Zero-phase low-pass filter of the (samples, channels) array x: the
+    Butterworth filter is applied forward and then backward, so peaks stay
+    where they are. Each end is padded with a point reflection first.
+    """
+    sos = butterworth_sos(cutoff_hz / _PASSES_CORRECTION, sample_rate_hz)
+    return signal.sosfiltfilt(sos, x, axis=0, padtype="odd", padlen=min(PAD_SAMPLES, len(x) - 1))
+
+
+def compute_derived_channels(df):
+    """
+    Filtered copies of every COLOR_MAP column in df, plus acceleration of
+    the segment speeds (px/s²) and angular velocity of the joint angles
+    (deg/s), both differentiated from the filtered signals.
+    All channels are processed together as one array. Samples missing in the
+    source are missing in the outputs too.
+    """
+    channels = [col for col in COLOR_MAP if col in df.columns]
+    t = df[TIME_COL].to_numpy(dtype=np.float64)
+    out = pd.DataFrame({TIME_COL: df[TIME_COL].to_numpy()})
+    if not channels or len(df) < 3:
+        return out
+
+    raw = df[channels].astype(np.float64)
+    missing = raw.isna().to_numpy()
+    values = raw.interpolate(limit_direction="both").fillna(0.0).to_numpy()
+
+    sample_rate_hz = 1000.0 / float(np.median(np.diff(t)))
+    filtered = filtfilt(values, sample_rate_hz)
+    rates = np.gradient(filtered, t / 1000.0, axis=0)
+    filtered[missing] = np.nan
+    rates[missing] = np.nan
+
+    for j, col in enumerate(channels):
+        out[f"{col}{FILTERED_SUFFIX}"] = filtered[:, j].astype(np.float32)
+    for j, col in enumerate(channels):
+        if col in SEGMENTS:
+            out[f"{col}{ACCEL_SUFFIX}"] = rates[:, j].astype(np.float32)
+        elif col in ANGLE_CHANNELS:
+            out[f"{col}{VELOCITY_SUFFIX}"] = rates[:, j].astype(np.float32)
+    return out
+
+
+def derived_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + DERIVED_EXT
+
+
+def write_derived_channels(csv_path, arrow_path=None):
+    """Computes a session's derived channels and stores them next to its CSV. Returns the path."""
+    path = derived_path_for(csv_path)
+    derived = compute_derived_channels(load_session_data(csv_path, arrow_path))
+    # Written to a temp file in the same directory so concurrent readers never
+    # see half a file and concurrent writers never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            derived.to_feather(out, compression="uncompressed")
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def load_derived_channels(csv_path, arrow_path=None):
+    """
+    A session's derived channels, computed once and kept on disk until the
+    CSV changes. Reads go through the same in-memory cache as Kinovea data,
+    so reruns and both compare panes reuse one frame.
+    """
+    with timed("derived", os.path.basename(csv_path)):
+        path = derived_path_for(csv_path)
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(csv_path):
+            write_derived_channels(csv_path, arrow_path)
+        return load_kinovea_csv(path)
@@ -0,0 +1,196 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from analytics import SEGMENTS, batch_sequence_metrics
+from db import query_df, query_rows
+from kinovea import COLOR_MAP, TIME_COL, load_session_data
+from session_metrics import csv_checksum
+
+# Every session is summarized as its COLOR_MAP curves resampled onto the same
+# EMBED_POINTS grid around the TE peak (ball release), stored as one float32
+# BLOB. Channels a capture doesn't have are NaN and ignored when comparing.
+EMBED_CHANNELS = list(COLOR_MAP)
+EMBED_EVENT = "TE"
+EMBED_WINDOW = (-400, 200)
+EMBED_POINTS = 32
+EMBED_GRID = np.linspace(EMBED_WINDOW[0], EMBED_WINDOW[1], EMBED_POINTS)
+
+# Speeds (px/s) and angles (deg) are divided by a typical range so no channel
+# dominates the distance
+CHANNEL_SCALES = np.array([1000.0 if ch in SEGMENTS else 180.0 for ch in EMBED_CHANNELS], dtype=np.float32)
+
+# Candidates kept from the L2 pass for DTW re-ranking, and the DTW warping
+# window in grid points (about 75 ms)
+SHORTLIST_SIZE = 50
+DTW_BAND = 4
+
+UPSERT_SQL = '''INSERT INTO session_embeddings (session_id, csv_sha256, embedding, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT(session_id) DO UPDATE SET
+    csv_sha256 = excluded.csv_sha256, embedding = excluded.embedding, updated_at = excluded.updated_at'''
+
+# Embedding matrix per database file, reloaded only when the table's version
+# counter (bumped by triggers on every write) moves
+_matrix_cache = {}
+
+
+def batch_embeddings(frames):
+    """
+    Returns (sessions, channels, points) float32 curves for a list of Kinovea
+    DataFrames. Curves are held at their edge values outside the capture; a
+    session without a TE peak comes out all NaN.
+    """
+    event_times = batch_sequence_metrics(frames)[f"{EMBED_EVENT.lower()}_peak_time"].to_numpy()
+    embeddings = np.full((len(frames), len(EMBED_CHANNELS), EMBED_POINTS), np.nan, dtype=np.float32)
+    for i, (df, event_time) in enumerate(zip(frames, event_times)):
+        if np.isnan(event_time):
+            continue
+        t = df[TIME_COL].to_numpy(dtype=np.float64) - event_time
+        for j, channel in enumerate(EMBED_CHANNELS):
+            if channel in df.columns:
+                embeddings[i, j] = np.interp(EMBED_GRID, t, df[channel].to_numpy(dtype=np.float64))
+    return embeddings
+
+
+def session_embedding(df):
+    return batch_embeddings([df])[0]
+
+
+def store_session_embeddings(conn, rows):
+    """Writes (session_id, csv_sha256, embedding) rows, skipping sessions with no TE peak. The caller commits."""
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(UPSERT_SQL, [
+        (int(session_id), checksum, embedding.astype(np.float32).tobytes(), now)
+        for session_id, checksum, embedding in rows
+        if not np.isnan(embedding).all()
+    ])
+
+
+def refresh_session_embeddings(conn, sessions):
+    """
+    Brings session_embeddings up to date for (session_id, csv_path,
+    arrow_path) tuples, skipping sessions whose CSV checksum matches the
+    stored row. Returns the number of sessions recomputed. The caller commits.
+    """
+    sessions = [s for s in sessions if s[1] and os.path.exists(s[1])]
+    if not sessions:
+        return 0
+    stored = dict(conn.execute(
+        "SELECT session_id, csv_sha256 FROM session_embeddings WHERE session_id IN (SELECT value FROM json_each(?))",
+        (json.dumps([int(s[0]) for s in sessions]),),
+    ).fetchall())
+
+    stale, checksums, frames = [], [], []
+    for session_id, csv_path, arrow_path in sessions:
+        checksum = csv_checksum(csv_path)
+        if stored.get(session_id) == checksum:
+            continue
+        try:
+            frames.append(load_session_data(csv_path, arrow_path))
+        except Exception:
+            continue
+        stale.append(session_id)
+        checksums.append(checksum)
+
+    if not stale:
+        return 0
+    store_session_embeddings(conn, zip(stale, checksums, batch_embeddings(frames)))
+    return len(stale)
+
+
+def refresh_all_session_embeddings(conn):
+    """Refreshes session_embeddings for every session that has a CSV."""
+    rows = conn.execute(
+        "SELECT id, kinovea_csv, kinovea_arrow FROM sessions WHERE kinovea_csv IS NOT NULL"
+    ).fetchall()
+    return refresh_session_embeddings(conn, rows)
+
+
+def _embedding_matrix(conn):
+    # (ids, scaled embeddings) for every stored session, cached until a row
+    # is added, removed or rewritten
+    db_file = conn.execute("PRAGMA database_list").fetchone()[2]
+    version = query_rows(conn, "SELECT version FROM table_versions WHERE name = 'session_embeddings'",
+                         label="embedding version")
+    cached = _matrix_cache.get(db_file)
+    if cached and cached[0] == version:
+        return cached[1], cached[2]
+
+    rows = query_rows(conn, "SELECT session_id, embedding FROM session_embeddings ORDER BY session_id",
+                      label="embedding matrix")
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+    matrix = matrix.reshape(len(rows), len(EMBED_CHANNELS), EMBED_POINTS) / CHANNEL_SCALES[:, None]
+    _matrix_cache[db_file] = (version, ids, matrix)
+    return ids, matrix
+
+
+def l2_distances(query, matrix):
+    """
+    Root mean squared difference between query (channels, points) and every
+    row of matrix, over the channels both sides have.
+    """
+    diff = matrix - query[None]
+    valid = ~np.isnan(diff)
+    sq = np.where(valid, diff, 0.0) ** 2
+    counts = valid.sum(axis=(1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, np.sqrt(sq.sum(axis=(1, 2)) / np.maximum(counts, 1)), np.inf)
+
+
+def dtw_distance(a, b, band=DTW_BAND):
+    """
+    Dynamic time warping distance between two (channels, points) curves over
+    their shared channels, with a Sakoe-Chiba band of band grid points.
+    """
+    shared = ~np.isnan(a).any(axis=1) & ~np.isnan(b).any(axis=1)
+    if not shared.any():
+        return np.inf
+    a, b = a[shared].T, b[shared].T
+    n, m = len(a), len(b)
+    cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+
+    acc = np.full((n + 1, m + 1), np.inf)
+    acc[0, 0] = 0.0
+    for i in range(1, n + 1):
+        for j in range(max(1, i - band), min(m, i + band) + 1):
+            acc[i, j] = cost[i - 1, j - 1] + min(acc[i - 1, j - 1], acc[i - 1, j], acc[i, j - 1])
+    return acc[n, m] / (n + m)
+
+
+def find_similar(conn, df, k=5, exclude_id=None, shortlist=SHORTLIST_SIZE):
+    """
+    The k sessions whose curves are closest to df's. Candidates come from a
+    vectorized L2 pass over the stored embeddings and only the shortlist is
+    re-ranked by DTW. Returns a DataFrame ordered by DTW distance.
+    """
+    query = session_embedding(df) / CHANNEL_SCALES[:, None]
+    ids, matrix = _embedding_matrix(conn)
+    if np.isnan(query).all() or not len(ids):
+        return pd.DataFrame(columns=["id", "player", "date", "session_name", "l2", "dtw"])
+
+    distances = l2_distances(query, matrix)
+    if exclude_id is not None:
+        distances[ids == int(exclude_id)] = np.inf
+    order = np.argsort(distances)[:shortlist]
+    order = order[np.isfinite(distances[order])]
+
+    ranked = sorted(((dtw_distance(query, matrix[i]), i) for i in order), key=lambda pair: pair[0])[:k]
+    if not ranked:
+        return pd.DataFrame(columns=["id", "player", "date", "session_name", "l2", "dtw"])
+
+    result = pd.DataFrame({
+        "id": [int(ids[i]) for _, i in ranked],
+        "l2": [float(distances[i]) for _, i in ranked],
+        "dtw": [float(d) for d, _ in ranked],
+    })
+    info = query_df(
+        conn,
+        '''SELECT s.id, p.name AS player, s.date, s.session_name
+           FROM sessions s LEFT JOIN players p ON p.id = s.player_id
+           WHERE s.id IN (SELECT value FROM json_each(?))''',
+        (json.dumps([int(i) for i in result["id"]]),), label="similar sessions")
+    return result.merge(info, on="id")[["id", "player", "date", "session_name", "l2", "dtw"]].round(4)
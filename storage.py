@@ -0,0 +1,71 @@
+import hashlib
+import os
+import tempfile
+
+DATA_DIR = "data"
+VIDEO_DIR = "videos"
+
+# Uploads are copied and hashed this many bytes at a time
+CHUNK_SIZE = 1024 * 1024
+
+
+def csv_path_for(player_name, session_name, session_date=None, data_dir=DATA_DIR, taken=()):
+    """
+    Where a session's CSV is stored: <player>_<session>_<date>.csv, with a
+    _2, _3, ... suffix when that name exists on disk or is in taken, so a
+    new session never overwrites another session's files.
+    """
+    parts = [player_name, session_name] + ([str(session_date)] if session_date else [])
+    base = f"{data_dir}/{'_'.join(part.replace(' ', '_') for part in parts)}"
+    path, n = f"{base}.csv", 2
+    while path in taken or os.path.exists(path):
+        path, n = f"{base}_{n}.csv", n + 1
+    return path
+
+
+def _copy_and_hash(fileobj, out):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+        out.write(chunk)
+    return digest.hexdigest()
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_video(fileobj, original_name, video_dir=VIDEO_DIR):
+    """
+    Streams an uploaded video into video_dir in CHUNK_SIZE pieces while hashing
+    it, and stores it as <sha256><ext>. If the same content is already stored
+    the new copy is dropped. Returns (path, sha256).
+
+    The chunked copy only bounds memory for real files, as in bulk_ingest.
+    Streamlit's UploadedFile already holds the whole upload in memory; its
+    size is capped by server.maxUploadSize in .streamlit/config.toml.
+    """
+    ext = os.path.splitext(original_name)[1].lower() or ".mp4"
+    fileobj.seek(0)
+
+    # Write to a temp file in the same directory so the final rename is atomic
+    fd, tmp_path = tempfile.mkstemp(dir=video_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            sha256 = _copy_and_hash(fileobj, out)
+
+        path = os.path.join(video_dir, sha256 + ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return path, sha256
@@ -0,0 +1,34 @@
+"""
+Header-only mp4 files for the tests and the benchmark: just enough boxes
+(ftyp, moov with one video track, mdat) for video_index.read_video_index.
+"""
+import struct
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind.encode()) + payload
+
+
+def full_box(kind, payload):
+    return box(kind, bytes(4) + payload)
+
+
+def synthetic_mp4(timescale=600, runs=((10, 20), (1, 10)), sync=(1, 6), stts_entries=None, size=(640, 360)):
+    """
+    An mp4 with one avc1 video track. runs are the (frame count, frame
+    duration) entries of its stts box, sync the 1-based keyframe numbers
+    (None leaves out stss, making every frame a keyframe). stts_entries
+    overrides the entry count written, to build corrupt files.
+    """
+    stts_entries = len(runs) if stts_entries is None else stts_entries
+    stts = full_box("stts", struct.pack(">I", stts_entries) + b"".join(struct.pack(">II", *r) for r in runs))
+    stbl = full_box("stsd", struct.pack(">I", 1) + struct.pack(">I4s", 16, b"avc1")) + stts
+    if sync is not None:
+        stbl += full_box("stss", struct.pack(">I", len(sync)) + b"".join(struct.pack(">I", s) for s in sync))
+    duration = sum(count * delta for count, delta in runs)
+    mdia = (full_box("mdhd", bytes(8) + struct.pack(">II", timescale, duration) + bytes(4))
+            + full_box("hdlr", bytes(4) + b"vide" + bytes(12))
+            + box("minf", box("stbl", stbl)))
+    width, height = size
+    trak = box("tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16)) + box("mdia", mdia)
+    return box("ftyp", b"isom") + box("moov", box("trak", trak)) + box("mdat", bytes(64))
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The app is a flat set of modules at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import connect  # noqa: E402
+from migrate_sessions_schema import run_migrations  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """An empty app directory with data/ and videos/, used as the working directory."""
+    (tmp_path / "data").mkdir()
+    (tmp_path / "videos").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db_path(workdir):
+    """A migrated, empty database in workdir."""
+    path = str(workdir / "test.db")
+    with connect(path) as conn:
+        run_migrations(conn)
+    return path
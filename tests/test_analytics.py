@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from analytics import align_sessions
+from kinovea import TIME_COL
+
+
+def capture(start, interval=10.0, n=60):
+    t = start + interval * np.arange(n)
+    return pd.DataFrame({TIME_COL: t, "FH": np.exp(-0.5 * ((t - t[n // 2]) / 40) ** 2), "TE": t - start})
+
+
+def test_align_sessions_skips_frames_without_time():
+    frames = [capture(0), pd.DataFrame({"FH": [1.0, 2.0, 3.0]}), capture(500).iloc[:1], capture(1000)]
+    grid, curves = align_sessions(frames, "TE", window=(-100, 100))
+    assert grid[1] - grid[0] == 10.0
+    assert np.isnan(curves[1]).all()
+    assert np.isnan(curves[2]).all()
+    np.testing.assert_allclose(curves[0], curves[3])
+    assert not np.isnan(curves[0]).any()
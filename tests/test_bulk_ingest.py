@@ -0,0 +1,71 @@
+import os
+import shutil
+
+import pytest
+
+import bulk_ingest
+from db import connect
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "Cole_Dickson_92.csv")
+
+
+@pytest.fixture
+def archive(workdir):
+    directory = workdir / "archive"
+    directory.mkdir()
+    shutil.copyfile(SAMPLE_CSV, directory / "pen.csv")
+    (directory / "pen.mp4").write_bytes(b"video")
+    (directory / "manifest.csv").write_text(
+        "player,team,date,session_name,csv,video,notes\n"
+        "Cole Dickson,Team,2024-03-01,Bullpen,pen.csv,pen.mp4,\n"
+        "Cole Dickson,Team,2024-03-02,Live,,https://youtu.be/x,\n"
+    )
+    return str(directory)
+
+
+def ingest(archive, db_path):
+    return bulk_ingest.ingest(archive, os.path.join(archive, "manifest.csv"), db_path=db_path, workers=1)
+
+
+def data_files():
+    return sorted(os.listdir("data"))
+
+
+def test_ingest_moves_files_into_place(archive, db_path):
+    assert ingest(archive, db_path) == 2
+    assert data_files() == ["Cole_Dickson_Bullpen_2024-03-01.arrow", "Cole_Dickson_Bullpen_2024-03-01.csv"]
+
+
+def test_rerun_skips_imported_rows(archive, db_path, capsys):
+    ingest(archive, db_path)
+    assert ingest(archive, db_path) == 0
+    assert capsys.readouterr().out.count("session already imported") == 2
+    with connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 2
+
+
+def test_failed_transaction_leaves_no_files(archive, db_path, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(bulk_ingest, "store_session_metrics", fail)
+        with pytest.raises(RuntimeError):
+            ingest(archive, db_path)
+    assert data_files() == []
+    with connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
+
+    assert ingest(archive, db_path) == 2
+
+
+def test_weekly_sessions_with_the_same_name_all_import(archive, db_path):
+    with open(os.path.join(archive, "manifest.csv"), "a") as f:
+        f.write("Cole Dickson,Team,2024-03-08,Bullpen,pen.csv,pen.mp4,\n")
+    open(os.path.join("data", "Cole_Dickson_Bullpen_2024-03-08.csv"), "w").close()
+
+    assert ingest(archive, db_path) == 3
+    with connect(db_path) as conn:
+        csvs = [row[0] for row in conn.execute("SELECT kinovea_csv FROM sessions WHERE kinovea_csv IS NOT NULL")]
+    assert sorted(csvs) == ["data/Cole_Dickson_Bullpen_2024-03-01.csv", "data/Cole_Dickson_Bullpen_2024-03-08_2.csv"]
+    assert all(os.path.getsize(path) for path in csvs)
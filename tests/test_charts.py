@@ -0,0 +1,27 @@
+import numpy as np
+
+from charts import lttb
+
+
+def test_lttb_keeps_ends_and_peaks():
+    x = np.arange(10_000) / 100.0
+    y = np.sin(x)
+    y[4321] = 25.0
+    idx = lttb(x, y, 500)
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+    assert 4321 in idx
+
+
+def test_lttb_skips_nan_gaps():
+    x = np.arange(1_000, dtype=float)
+    y = np.cos(x / 50)
+    y[200:400] = np.nan
+    idx = lttb(x, y, 100)
+    assert len(idx) == 100
+    assert not np.isnan(y[idx][(idx < 190) | (idx > 410)]).any()
+
+
+def test_lttb_returns_everything_when_short():
+    assert list(lttb(np.arange(5.0), np.arange(5.0), 10)) == [0, 1, 2, 3, 4]
@@ -0,0 +1,15 @@
+from db import connect, get_or_create_player
+
+
+def test_player_upsert_reuses_id_without_touching_the_row(db_path):
+    with connect(db_path) as conn:
+        player_id = get_or_create_player(conn.cursor(), "Ryan Ott", "ATU")
+        conn.execute("CREATE TEMP TABLE player_updates (id INTEGER)")
+        conn.execute('''CREATE TEMP TRIGGER watch_players AFTER UPDATE OF name, team, notes ON players BEGIN
+            INSERT INTO player_updates VALUES (new.id);
+        END''')
+
+        assert get_or_create_player(conn.cursor(), "ryan ott", "atu") == player_id
+        assert get_or_create_player(conn.cursor(), "Ryan Ott", "Org B") != player_id
+        assert conn.execute("SELECT COUNT(*) FROM player_updates").fetchone()[0] == 0
+        assert conn.execute("SELECT name FROM players WHERE id = ?", (player_id,)).fetchone()[0] == "Ryan Ott"
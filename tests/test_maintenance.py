@@ -0,0 +1,132 @@
+import os
+import time
+
+from db import connect
+from maintenance import (RECENT_FILE_GRACE_SECONDS, delete_orphan_files, delete_sessions, find_broken_sessions,
+                         find_orphan_files, hash_videos, main)
+from storage import file_sha256
+
+
+def add_session(conn, player, csv_path, video_source):
+    player_id = conn.execute(
+        "INSERT INTO players (name, team, notes) VALUES (?, 'Team', '') RETURNING id", (player,)
+    ).fetchone()[0]
+    session_id = conn.execute(
+        '''INSERT INTO sessions (player_id, date, session_name, video_source, kinovea_csv, notes)
+           VALUES (?, '2024-01-01', 'Bullpen', ?, ?, '') RETURNING id''',
+        (player_id, video_source, csv_path),
+    ).fetchone()[0]
+    conn.commit()
+    return session_id
+
+
+def touch(path, age=RECENT_FILE_GRACE_SECONDS + 60):
+    with open(path, "wb") as f:
+        f.write(b"x")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_windows_paths_are_not_broken(db_path):
+    touch(os.path.join("videos", "clip.mp4"))
+    with connect(db_path) as conn:
+        add_session(conn, "Ryan Ott", None, "videos\\clip.mp4")
+        assert find_broken_sessions(conn) == []
+
+
+def test_missing_files_are_broken(db_path):
+    with connect(db_path) as conn:
+        session_id = add_session(conn, "Ryan Ott", "data\\gone.csv", "videos\\gone.mp4")
+        assert find_broken_sessions(conn) == [session_id]
+
+
+def test_all_keeps_windows_path_sessions_and_files(db_path):
+    video = touch(os.path.join("videos", "clip.mp4"))
+    with connect(db_path) as conn:
+        add_session(conn, "Ryan Ott", None, "videos\\clip.mp4")
+
+    main(["--all", "--db", db_path])
+
+    with connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM players").fetchone()[0] == 1
+    assert os.path.exists(video)
+
+
+def test_all_does_not_delete_files(db_path):
+    orphan = touch(os.path.join("data", "unused.csv"))
+    main(["--all", "--db", db_path])
+    assert os.path.exists(orphan)
+
+
+def test_dry_run_matches_real_run(db_path, capsys):
+    video = touch(os.path.join("videos", "clip.mp4"))
+    with connect(db_path) as conn:
+        add_session(conn, "Ryan Ott", "data/gone.csv", video)
+
+    main(["--broken-sessions", "--orphan-players", "--orphan-files", "--dry-run", "--db", db_path])
+    out = capsys.readouterr().out
+    assert "Would remove 1 broken session(s)" in out
+    assert "Would remove 1 player(s)" in out
+    assert "Would remove 1 orphaned file(s)" in out
+    assert os.path.exists(video)
+
+    main(["--broken-sessions", "--orphan-players", "--orphan-files", "--db", db_path])
+    out = capsys.readouterr().out
+    assert "Removed 1 broken session(s)" in out
+    assert "Removed 1 player(s)" in out
+    assert "Removed 1 orphaned file(s)" in out
+    assert not os.path.exists(video)
+
+
+def test_orphan_files_skip_referenced_windows_paths(db_path):
+    touch(os.path.join("videos", "clip.mp4"))
+    orphan = touch(os.path.join("videos", "other.mp4"))
+    with connect(db_path) as conn:
+        add_session(conn, "Ryan Ott", None, "videos\\clip.mp4")
+        assert find_orphan_files(conn) == [os.path.normpath(orphan)]
+
+
+def test_delete_prunes_only_unused_video_metadata(db_path):
+    with connect(db_path) as conn:
+        gone = add_session(conn, "Ryan Ott", None, "videos/gone.mp4")
+        shared = add_session(conn, "Ryan Ott 2", None, "videos/shared.mp4")
+        add_session(conn, "Ryan Ott 3", None, "videos/shared.mp4")
+        add_session(conn, "Ryan Ott 4", None, "videos/kept.mp4")
+        conn.executemany("INSERT INTO video_metadata (path, error, indexed_at) VALUES (?, 'unreadable', '')",
+                         [("videos/gone.mp4",), ("videos/shared.mp4",), ("videos/kept.mp4",), ("videos/stray.mp4",)])
+        assert delete_sessions(conn, [gone, shared]) == 2
+        conn.commit()
+        remaining = {row[0] for row in conn.execute("SELECT path FROM video_metadata")}
+        assert remaining == {"videos/shared.mp4", "videos/kept.mp4", "videos/stray.mp4"}
+
+
+def test_recent_files_are_not_orphaned(db_path):
+    touch(os.path.join("data", "upload.csv"), age=0)
+    orphan = touch(os.path.join("data", "old.csv"))
+    with connect(db_path) as conn:
+        assert find_orphan_files(conn) == [os.path.normpath(orphan)]
+
+
+def test_delete_orphan_files_rechecks_references(db_path):
+    claimed = touch(os.path.join("videos", "claimed.mp4"))
+    orphan = touch(os.path.join("videos", "other.mp4"))
+    with connect(db_path) as conn:
+        orphans = find_orphan_files(conn)
+        add_session(conn, "Ryan Ott", None, claimed)
+        assert delete_orphan_files(conn, orphans) == 1
+    assert os.path.exists(claimed)
+    assert not os.path.exists(orphan)
+
+
+def test_hash_videos_backfills_missing_hashes(db_path):
+    video = touch(os.path.join("videos", "clip.mp4"))
+    with connect(db_path) as conn:
+        session_id = add_session(conn, "Ryan Ott", None, "videos\\clip.mp4")
+        add_session(conn, "Ryan Ott 2", None, "videos\\gone.mp4")
+        assert hash_videos(conn) == 1
+        conn.commit()
+        hashes = dict(conn.execute("SELECT id, video_sha256 FROM sessions").fetchall())
+        assert hashes[session_id] == file_sha256(video)
+        assert hash_videos(conn) == 0
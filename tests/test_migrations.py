@@ -0,0 +1,62 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from db import connect
+from maintenance import backfill
+from migrate_sessions_schema import MIGRATIONS, create_base_tables, run_migrations, schema_version
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "Cole_Dickson_92.csv")
+
+
+def original_database(workdir, sessions=1):
+    # The schema and data of a database from before any migration existed
+    csv_path = os.path.join("data", "Cole_Dickson_92.csv")
+    shutil.copyfile(SAMPLE_CSV, csv_path)
+    db_path = str(workdir / "old.db")
+    with connect(db_path) as conn:
+        c = conn.cursor()
+        create_base_tables(c)
+        c.execute("INSERT INTO players (name, team, notes) VALUES ('Cole Dickson', 'ATU', '')")
+        c.execute("INSERT INTO players (name, team, notes) VALUES ('cole dickson', 'atu', '')")
+        c.executemany('''INSERT INTO sessions (player_id, date, session_name, video_source, kinovea_csv, notes)
+                         VALUES (2, '2024-05-01', ?, 'https://youtu.be/x', ?, '')''',
+                      [(f"Bullpen {i}", csv_path) for i in range(sessions)])
+        conn.commit()
+    return db_path
+
+
+def test_migrates_an_original_database(workdir):
+    db_path = original_database(workdir)
+    with connect(db_path) as conn:
+        assert len(run_migrations(conn)) == len(MIGRATIONS)
+        assert schema_version(conn) == len(MIGRATIONS)
+        assert conn.execute("SELECT player_id FROM sessions").fetchone()[0] == 1
+        # Nothing that reads files runs at startup
+        assert conn.execute("SELECT kinovea_arrow FROM sessions").fetchone()[0] is None
+        assert conn.execute("SELECT COUNT(*) FROM session_metrics").fetchone()[0] == 0
+
+        assert backfill(conn) == {"columnar copies": 1, "session metrics": 1, "session embeddings": 1,
+                                  "video index": 0}
+        assert conn.execute("SELECT COUNT(*) FROM session_embeddings").fetchone()[0] == 1
+        assert conn.execute(
+            "SELECT DISTINCT team, month, SUM(count) FROM metric_sketches WHERE metric = 'te_peak_speed'"
+        ).fetchall() == [("ATU", "2024-05", 1)]
+        assert run_migrations(conn) == []
+
+
+def test_concurrent_startups_migrate_once(workdir):
+    db_path = original_database(workdir, sessions=200)
+
+    def migrate(_):
+        with connect(db_path) as conn:
+            return run_migrations(conn)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(migrate, range(4)))
+    assert sorted(len(applied) for applied in results) == [0, 0, 0, len(MIGRATIONS)]
+
+
+def test_fresh_database(db_path):
+    with connect(db_path) as conn:
+        assert schema_version(conn) == len(MIGRATIONS)
@@ -0,0 +1,15 @@
+from db import connect
+from session_metrics import csv_checksum, stale_sessions
+
+
+def test_stale_sessions_compares_checksums(db_path, workdir):
+    fresh, changed, new = (str(workdir / "data" / f"{name}.csv") for name in ("fresh", "changed", "new"))
+    for path in (fresh, changed, new):
+        with open(path, "w") as f:
+            f.write("Time (ms)\n0\n")
+    sessions = [(1, fresh, None), (2, changed, None), (3, new, None), (4, str(workdir / "data" / "gone.csv"), None)]
+
+    with connect(db_path) as conn:
+        conn.executemany("INSERT INTO session_metrics (session_id, csv_sha256) VALUES (?, ?)",
+                         [(1, csv_checksum(fresh)), (2, "outdated")])
+        assert stale_sessions(conn, sessions) == [sessions[1], sessions[2]]
@@ -0,0 +1,26 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from kinovea import TIME_COL
+from signals import DERIVED_EXT, filtfilt, load_derived_channels
+
+
+def test_filtfilt_keeps_constants_and_peak_times():
+    t = np.arange(0, 2000, 4.0)
+    peak = np.exp(-0.5 * ((t - 1000) / 80) ** 2)
+    x = np.column_stack([np.full_like(t, 5.0), peak])
+    y = filtfilt(x, sample_rate_hz=250.0)
+    np.testing.assert_allclose(y[:, 0], 5.0)
+    assert np.argmax(y[:, 1]) == np.argmax(peak)
+
+
+def test_derived_channels_are_written_next_to_the_csv(workdir):
+    t = np.arange(0, 1000, 10.0)
+    csv_path = os.path.join("data", "session.csv")
+    pd.DataFrame({TIME_COL: t, "TE": np.sin(t / 100)}).to_csv(csv_path, index=False)
+
+    derived = load_derived_channels(csv_path)
+    assert {"TE (filtered)", "TE accel"} <= set(derived.columns)
+    assert sorted(os.listdir("data")) == ["session.csv", f"session{DERIVED_EXT}"]
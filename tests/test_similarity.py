@@ -0,0 +1,25 @@
+import numpy as np
+
+from db import connect
+from similarity import CHANNEL_SCALES, EMBED_CHANNELS, EMBED_POINTS, _embedding_matrix, store_session_embeddings
+
+
+def embedding(value):
+    return np.full((len(EMBED_CHANNELS), EMBED_POINTS), value, dtype=np.float32)
+
+
+def test_matrix_cache_follows_every_write(db_path):
+    with connect(db_path) as conn:
+        store_session_embeddings(conn, [(1, "a", embedding(1.0)), (2, "b", embedding(2.0))])
+        conn.commit()
+        assert _embedding_matrix(conn)[0].tolist() == [1, 2]
+
+        # Same row count and the same second: only the version counter moves
+        conn.execute("DELETE FROM session_embeddings WHERE session_id = 2")
+        store_session_embeddings(conn, [(3, "c", embedding(3.0))])
+        conn.commit()
+        assert _embedding_matrix(conn)[0].tolist() == [1, 3]
+
+        store_session_embeddings(conn, [(1, "a2", embedding(5.0))])
+        conn.commit()
+        np.testing.assert_allclose(_embedding_matrix(conn)[1][0], embedding(5.0) / CHANNEL_SCALES[:, None])
@@ -0,0 +1,57 @@
+import pytest
+
+from db import connect
+from synthetic_video import synthetic_mp4 as mp4
+from video_index import get_video_metadata, read_video_index, refresh_video_metadata
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_reads_header(tmp_path):
+    info = read_video_index(write(tmp_path / "clip.mp4", mp4()))
+    assert info["frame_count"] == 11
+    assert info["fps"] == pytest.approx(30.0)
+    assert info["duration_s"] == pytest.approx(210 / 600)
+    assert (info["width"], info["height"], info["codec"]) == (640, 360, "avc1")
+    assert info["keyframes"] == [0.0, round(100 / 600, 4)]
+
+
+def test_every_frame_is_a_keyframe_without_stss(tmp_path):
+    info = read_video_index(write(tmp_path / "clip.mp4", mp4(runs=((2, 20), (2, 10)), sync=None)))
+    assert info["keyframes"] == [0.0, round(20 / 600, 4), round(40 / 600, 4), round(50 / 600, 4)]
+
+
+def test_zero_timescale_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        read_video_index(write(tmp_path / "clip.mp4", mp4(timescale=0)))
+
+
+def test_entry_count_past_the_box_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        read_video_index(write(tmp_path / "clip.mp4", mp4(stts_entries=2 ** 31)))
+
+
+def test_huge_frame_counts_are_not_expanded(tmp_path):
+    with pytest.raises(ValueError):
+        read_video_index(write(tmp_path / "clip.mp4", mp4(runs=((2 ** 32 - 1, 1),))))
+
+
+def test_bad_files_are_stored_with_their_error(db_path, workdir):
+    good = write(workdir / "videos" / "good.mp4", mp4())
+    bad = [
+        write(workdir / "videos" / "zero.mp4", mp4(timescale=0)),
+        write(workdir / "videos" / "count.mp4", mp4(stts_entries=2 ** 31)),
+        write(workdir / "videos" / "truncated.mp4", mp4()[:40]),
+        write(workdir / "videos" / "text.mp4", b"not a video at all"),
+    ]
+    with connect(db_path) as conn:
+        assert refresh_video_metadata(conn, [good, *bad]) == 5
+        conn.commit()
+        errors = dict(conn.execute("SELECT path, error FROM video_metadata").fetchall())
+        assert errors[good] is None
+        assert all(errors[path] for path in bad)
+        assert get_video_metadata(conn, good)["frame_count"] == 11
+        assert get_video_metadata(conn, bad[0]) is None
@@ -0,0 +1,41 @@
+from db import get_or_create_player
+from session_metrics import refresh_session_metrics
+from similarity import refresh_session_embeddings
+from video_index import refresh_video_metadata
+
+
+def refresh_session_summaries(conn, sessions):
+    """
+    Brings the metrics and embeddings of (session_id, csv_path, arrow_path)
+    tuples up to date, skipping sessions whose CSV hasn't changed. Returns
+    the number of metric rows written. The caller commits.
+    """
+    refreshed = refresh_session_metrics(conn, sessions)
+    refresh_session_embeddings(conn, sessions)
+    return refreshed
+
+
+def save_session(conn, name, team, session_date, session_name, video_source, video_sha256, csv_path, arrow_path,
+                 notes):
+    """
+    Inserts an uploaded session, creating its player if needed, and brings
+    its metrics, embedding and video index up to date. Runs on the writer
+    thread, which commits it. Returns the new session id.
+    """
+    c = conn.cursor()
+
+    # Normalize and check existing player
+    player_id = get_or_create_player(c, name, team)
+
+    # Insert session (CSV path may be None)
+    c.execute('''INSERT INTO sessions
+                 (player_id, date, session_name, video_source, video_sha256, kinovea_csv, kinovea_arrow, notes)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+              (player_id, session_date, session_name, video_source, video_sha256, csv_path, arrow_path, notes))
+    session_id = int(c.lastrowid)
+
+    # Derived summaries for cross-session views
+    if csv_path:
+        refresh_session_summaries(conn, [(session_id, csv_path, arrow_path)])
+    refresh_video_metadata(conn, [video_source])
+    return session_id
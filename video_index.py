@@ -0,0 +1,259 @@
+import bisect
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from db import query_rows
+
+# Boxes walked on the way down to a video track's sample tables. Everything
+# else, including the media data itself, is skipped with a seek.
+CONTAINER_BOXES = {"moov", "trak", "mdia", "minf", "stbl"}
+
+# Above this many frames (over 12 hours at 240 fps) a sample table is taken to
+# be corrupt rather than listing every frame as a keyframe
+MAX_FRAME_COUNT = 10_000_000
+
+METADATA_COLUMNS = ["path", "size", "mtime_ns", "duration_s", "fps", "width", "height", "frame_count", "codec",
+                    "keyframes", "error", "indexed_at"]
+
+UPSERT_SQL = '''INSERT INTO video_metadata (path, size, mtime_ns, duration_s, fps, width, height, frame_count,
+        codec, keyframes, error, indexed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+    size = excluded.size, mtime_ns = excluded.mtime_ns, duration_s = excluded.duration_s, fps = excluded.fps,
+    width = excluded.width, height = excluded.height, frame_count = excluded.frame_count, codec = excluded.codec,
+    keyframes = excluded.keyframes, error = excluded.error, indexed_at = excluded.indexed_at'''
+
+
+# === Container parsing ===
+
+def _boxes(f, start, end):
+    # Yields (type, payload start, box end) for the boxes between start and end
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ValueError(f"corrupt box at byte {pos}")
+        yield kind.decode("latin-1"), pos + header, min(pos + size, end)
+        pos += size
+
+
+def _read(f, start, end):
+    f.seek(start)
+    return f.read(end - start)
+
+
+def _children(f, start, end):
+    return {kind: (payload, box_end) for kind, payload, box_end in _boxes(f, start, end)}
+
+
+def _timescale_duration(data):
+    # mvhd and mdhd share this layout: version 1 widens the times to 64 bits
+    if data[0] == 1:
+        timescale, duration = struct.unpack(">I Q", data[20:32])
+    else:
+        timescale, duration = struct.unpack(">I I", data[12:20])
+    if not timescale:
+        raise ValueError("zero timescale")
+    return timescale, duration
+
+
+def _table(data, entry_size, name):
+    # Full-box sample table: version/flags, entry count, then the entries.
+    # The count is checked against the box so a corrupt one can't run past it.
+    entries = struct.unpack(">I", data[4:8])[0]
+    if 8 + entry_size * entries > len(data):
+        raise ValueError(f"{name} lists {entries} entries, more than the box holds")
+    return np.frombuffer(data[8:8 + entry_size * entries], dtype=">u4").astype(np.int64)
+
+
+def _video_track(f, moov_start, moov_end):
+    for kind, start, end in _boxes(f, moov_start, moov_end):
+        if kind != "trak":
+            continue
+        trak = _children(f, start, end)
+        if "mdia" not in trak:
+            continue
+        mdia = _children(f, *trak["mdia"])
+        if "hdlr" in mdia and _read(f, *mdia["hdlr"])[8:12] == b"vide":
+            return trak, mdia
+    return None, None
+
+
+def read_video_index(path):
+    """
+    Reads a .mp4/.mov file's container header (no decoding, no ffmpeg) and
+    returns duration, frame rate, resolution, codec and keyframe times of its
+    first video track. Only the moov box is read; the media data is skipped
+    with seeks, so the cost does not grow with the file size.
+    Raises ValueError for files that aren't ISO media with a video track or
+    whose sample tables are inconsistent.
+    """
+    with open(path, "rb") as f:
+        file_end = os.fstat(f.fileno()).st_size
+        top = _children(f, 0, file_end)
+        if "moov" not in top:
+            raise ValueError("no moov box, not an mp4/mov file")
+        moov = _children(f, *top["moov"])
+
+        trak, mdia = _video_track(f, *top["moov"])
+        if trak is None:
+            raise ValueError("no video track")
+
+        timescale, duration = _timescale_duration(_read(f, *mdia["mdhd"]))
+        if not duration and "mvhd" in moov:
+            movie_timescale, movie_duration = _timescale_duration(_read(f, *moov["mvhd"]))
+            duration = movie_duration * timescale / movie_timescale
+
+        # Track width and height are 16.16 fixed point, the last 8 bytes of tkhd
+        tkhd_end = trak["tkhd"][1]
+        width, height = (v >> 16 for v in struct.unpack(">II", _read(f, tkhd_end - 8, tkhd_end)))
+
+        stbl = _children(f, *_children(f, *mdia["minf"])["stbl"])
+        stsd = _read(f, *stbl["stsd"])
+        codec = stsd[12:16].decode("latin-1") if len(stsd) >= 16 else None
+
+        # Sample durations are run-length encoded as (count, delta) pairs. Start
+        # times are worked out per run, never per frame.
+        runs = _table(_read(f, *stbl["stts"]), 8, "stts").reshape(-1, 2)
+        counts, deltas = runs[:, 0], runs[:, 1]
+        frame_count = int(counts.sum())
+        if frame_count > MAX_FRAME_COUNT:
+            raise ValueError(f"implausible frame count {frame_count}")
+        run_first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        run_start = np.concatenate([[0], np.cumsum(counts * deltas)[:-1]])
+
+        # Sync samples (1-based); without an stss box every frame is a keyframe
+        if "stss" in stbl:
+            sync = _table(_read(f, *stbl["stss"]), 4, "stss") - 1
+            sync = sync[(sync >= 0) & (sync < frame_count)]
+        else:
+            sync = np.arange(frame_count)
+        run = np.searchsorted(run_first, sync, side="right") - 1
+        keyframes = (run_start[run] + (sync - run_first[run]) * deltas[run]) / timescale
+
+    # Nominal rate from the typical frame duration (the count-weighted median
+    # delta), so a short final frame or a dropped one doesn't skew it
+    fps = None
+    if frame_count:
+        order = np.argsort(deltas, kind="stable")
+        median_run = order[np.searchsorted(np.cumsum(counts[order]), (frame_count + 1) // 2)]
+        fps = timescale / float(deltas[median_run]) if deltas[median_run] else None
+    return {
+        "duration_s": duration / timescale,
+        "fps": fps,
+        "width": width,
+        "height": height,
+        "frame_count": frame_count,
+        "codec": codec,
+        "keyframes": [round(float(t), 4) for t in keyframes],
+    }
+
+
+# === Stored metadata ===
+
+def is_indexable(video_source):
+    return bool(video_source) and not video_source.startswith("http") and os.path.exists(video_source)
+
+
+def refresh_video_metadata(conn, paths):
+    """
+    Indexes the local videos among paths whose size or mtime changed since
+    they were last indexed. Files that can't be parsed, whatever the reason,
+    are stored with their error so they aren't retried until they change and
+    never fail the write they are part of. Returns the number indexed. The
+    caller commits.
+    """
+    paths = sorted({p for p in paths if is_indexable(p)})
+    if not paths:
+        return 0
+    stored = {row[0]: tuple(row[1:]) for row in conn.execute(
+        "SELECT path, size, mtime_ns FROM video_metadata WHERE path IN (SELECT value FROM json_each(?))",
+        (json.dumps(paths),))}
+
+    rows = []
+    now = datetime.now().isoformat(timespec="seconds")
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if stored.get(path) == (stat.st_size, stat.st_mtime_ns):
+            continue
+        try:
+            info, error = read_video_index(path), None
+        except Exception as e:
+            info, error = {}, f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        rows.append((path, stat.st_size, stat.st_mtime_ns, info.get("duration_s"), info.get("fps"),
+                     info.get("width"), info.get("height"), info.get("frame_count"), info.get("codec"),
+                     json.dumps(info["keyframes"]) if info else None, error, now))
+    conn.executemany(UPSERT_SQL, rows)
+    return len(rows)
+
+
+def refresh_all_video_metadata(conn):
+    """Indexes every local video some session uses."""
+    paths = [row[0] for row in conn.execute(
+        "SELECT DISTINCT video_source FROM sessions WHERE video_source NOT LIKE 'http%'")]
+    return refresh_video_metadata(conn, paths)
+
+
+def prune_video_metadata(conn, paths):
+    """
+    Drops the metadata of those paths no session uses any more, e.g. the
+    videos of sessions just deleted. The caller commits.
+    """
+    conn.execute('''DELETE FROM video_metadata WHERE path IN (SELECT value FROM json_each(?)) AND NOT EXISTS
+                    (SELECT 1 FROM sessions WHERE sessions.video_source = video_metadata.path)''',
+                 (json.dumps(sorted({p for p in paths if p})),))
+
+
+def get_video_metadata(conn, path):
+    """Stored metadata of a video as a dict with keyframes as a list, or None if it isn't indexed."""
+    rows = query_rows(
+        conn, f"SELECT {', '.join(METADATA_COLUMNS)} FROM video_metadata WHERE path = ? AND error IS NULL",
+        (path,), label="video metadata")
+    if not rows:
+        return None
+    metadata = dict(zip(METADATA_COLUMNS, rows[0]))
+    metadata["keyframes"] = json.loads(metadata["keyframes"] or "[]")
+    return metadata
+
+
+# === Kinovea time to video time ===
+
+def video_time_s(time_ms, metadata=None, offset_ms=0.0):
+    """
+    Video timestamp (s) of a Kinovea "Time (ms)" value. Kinovea reports time
+    from the start of the video it tracked, shifted by offset_ms when the
+    export used a different time origin; the result is clamped to the video.
+    """
+    t = max(0.0, (float(time_ms) + offset_ms) / 1000)
+    if metadata and metadata.get("duration_s"):
+        t = min(t, metadata["duration_s"])
+    return t
+
+
+def frame_at(metadata, t):
+    """Frame number shown at t seconds."""
+    if not metadata or not metadata.get("fps"):
+        return None
+    return min(int(t * metadata["fps"]), max(metadata["frame_count"] - 1, 0))
+
+
+def keyframe_before(metadata, t):
+    """Time of the last keyframe at or before t, where a player's seek starts decoding."""
+    keyframes = metadata.get("keyframes") if metadata else None
+    if not keyframes:
+        return None
+    return keyframes[max(bisect.bisect_right(keyframes, t) - 1, 0)]
@@ -0,0 +1,94 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from db import DB_PATH, connect
+
+# Jobs already waiting when the writer wakes up are committed together, up
+# to this many per transaction
+BATCH_SIZE = 32
+
+# How long the UI waits for its write to be committed
+WRITE_TIMEOUT_SECONDS = 60
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class _Writer:
+    """
+    Owns the only connection that writes to one database file. Jobs are
+    fn(conn, *args) callables that must not commit; each runs inside a
+    savepoint so a failing job is rolled back without taking down the rest
+    of its batch, and every result is delivered only after the batch commits.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"sqlite-writer:{db_path}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        with connect(self.db_path) as conn:
+            while True:
+                batch = [self.jobs.get()]
+                while len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self.jobs.get_nowait())
+                    except queue.Empty:
+                        break
+                self._apply(conn, batch)
+
+    def _apply(self, conn, batch):
+        outcomes = []
+        try:
+            # IMMEDIATE takes the write lock up front instead of failing
+            # half-way through the batch if another process holds it
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = fn(conn, *args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def _get_writer(db_path):
+    with _writers_lock:
+        if db_path not in _writers:
+            _writers[db_path] = _Writer(db_path)
+        return _writers[db_path]
+
+
+def submit(fn, *args, db_path=DB_PATH):
+    """Queues fn(conn, *args) on the database's writer thread and returns a Future of its result."""
+    future = Future()
+    _get_writer(db_path).jobs.put((fn, args, future))
+    return future
+
+
+def write(fn, *args, db_path=DB_PATH, timeout=WRITE_TIMEOUT_SECONDS):
+    """Runs fn(conn, *args) on the writer thread and returns its result once committed, re-raising its error."""
+    return submit(fn, *args, db_path=db_path).result(timeout)